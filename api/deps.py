@@ -1,6 +1,9 @@
-from fastapi import Header
+import secrets
+from typing import Any, Awaitable, Callable, Optional
 
-from core.config import Language
+from fastapi import Header, HTTPException, Request
+
+from core.config import Language, settings
 from core.context import request_context
 
 
@@ -11,4 +14,38 @@ async def check_language_code(
         example=Language.English,
     )
 ) -> Language:
-    request_context.set("language", X_Language_Code)
+    request_context.state.language = X_Language_Code
+
+
+def route_timeout(timeout: float) -> Callable[[Request], Awaitable[Any]]:
+    """
+    Default deadline of the route, the one asked by the client in the header has the priority
+    """
+
+    async def _route_timeout(request: Request) -> None:
+        if settings.REQUEST_TIMEOUT_HEADER not in request.headers:
+            request_context.set_deadline(timeout)
+
+    return _route_timeout
+
+
+def has_debug_access(token: Optional[str]) -> bool:
+    if settings.DEBUG:
+        return True
+    return bool(settings.DEBUG_TOKEN and token and secrets.compare_digest(token, settings.DEBUG_TOKEN))
+
+
+async def check_debug_access(X_Debug_Token: Optional[str] = Header(None, include_in_schema=False)) -> None:
+    """
+    The debug endpoints only exist in DEBUG mode or for the holder of the debug token
+    """
+    if not has_debug_access(X_Debug_Token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+async def check_admin_access(X_Admin_Token: Optional[str] = Header(None, description="The admin token")) -> None:
+    """
+    The admin endpoints write many rows at once, only the holder of the admin token can call them
+    """
+    if not (settings.ADMIN_TOKEN and X_Admin_Token and secrets.compare_digest(X_Admin_Token, settings.ADMIN_TOKEN)):
+        raise HTTPException(status_code=403, detail="Forbidden")
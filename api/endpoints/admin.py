@@ -0,0 +1,39 @@
+from typing import Any, Dict
+
+import models
+import schemas
+import sqlalchemy as sa
+from fastapi import APIRouter, Depends
+
+from api.deps import check_admin_access
+
+
+router = APIRouter(dependencies=[Depends(check_admin_access)])
+
+
+@router.post("/doctors/reprice", response_model=schemas.BulkUpdateResult)
+async def reprice_doctors(data: schemas.DoctorReprice) -> Any:
+    """
+    Set, or change by a percentage, the price of all the matching doctors in a single UPDATE.
+    The changed prices are rounded half up to the cent and capped
+    """
+    filters: Dict[str, Any] = dict()
+    if data.area_id:
+        filters["area_id"] = data.area_id
+    if data.category_ids:
+        filters["category_id__in"] = data.category_ids
+    if data.price_min is not None:
+        filters["price__ge"] = data.price_min
+    if data.price_max is not None:
+        filters["price__le"] = data.price_max
+    if data.price is not None:
+        price = data.price
+    else:
+        # From the price rounded to the cent, as it's read (a SQLite float can hold more decimals), in integer
+        # cents: cents * factor / 10000 is exact on the halves and 1/10000 away from them otherwise, even as a
+        # float, so it's rounded half up the same way on every database
+        assert data.percent is not None, "Checked by DoctorReprice"
+        factor = int(10000 + data.percent * 100)
+        cents = sa.func.round(sa.func.round(models.Doctor.price * 100) * factor / 10000.0)
+        price = sa.case((cents > schemas.PRICE_MAX * 100, schemas.PRICE_MAX), else_=cents / 100)
+    return {"count": await models.Doctor.update_where(filters, {"price": price})}
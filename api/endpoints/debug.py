@@ -0,0 +1,38 @@
+from typing import Any
+
+import schemas
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from starlette.responses import Response
+
+from api.deps import check_debug_access
+from api.profiling import profiles
+from core.db.slow_queries import slow_query_log
+
+
+router = APIRouter(dependencies=[Depends(check_debug_access)])
+
+
+@router.get("/slow-queries", response_model=schemas.SlowQueries)
+async def list_slow_queries() -> Any:
+    """
+    The last slow queries logged by this worker, the most recent first (`SLOW_QUERY_LOG` must be on)
+    """
+    return {"items": slow_query_log.dump()}
+
+
+@router.get("/profiles/{profile_id}", response_model=schemas.Profile)
+async def retrieve_profile(
+    profile_id: str = Path(..., description="The profile id, from the X-Profile header of the profiled response"),
+    download: bool = Query(False, description="Download the raw pstats dump instead of the report"),
+) -> Any:
+    profile = profiles.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"Profile is not found {profile_id}")
+    report, dump = profile
+    if download:
+        return Response(
+            dump,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'},
+        )
+    return report
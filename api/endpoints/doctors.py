@@ -1,15 +1,24 @@
-from typing import Any, List, Optional
+import asyncio
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional, Tuple
 from uuid import UUID
 
 import models
 import schemas
-from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.encoders import jsonable_encoder
 from pydantic import condecimal
 from starlette import status
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
-from core.config import Language
+from api.deps import route_timeout
+from core.config import Language, settings
 from core.context import request_context
 from core.db.models import BaseModel
+from core.exceptions import overloaded_response
+from core.pubsub import Subscription, TooManySubscribers, pubsub
 
 
 router = APIRouter()
@@ -33,7 +42,7 @@ async def _process_instance(instance: models.Doctor) -> models.Doctor:
     Append addition data field for the Doctor
     """
     categories = await models.DoctorCategory.filter({"doctor_id": instance.id})
-    instance.category_ids = [item.id for item in categories]
+    instance.category_ids = [item.category_id for item in categories]
     return instance
 
 
@@ -47,35 +56,238 @@ async def create_doctor(
     return instance
 
 
-@router.get("/{doctor_id}", response_model=schemas.Doctor)
-async def retrieve_doctor(
-    doctor_id: UUID = Path(..., description="The doctor id", example=schemas.UUID_EXAMPLE)
-) -> Any:
-    instance = await _get_or_404(models.Doctor, doctor_id, language=request_context.language)
-    if instance:
-        instance = await _process_instance(instance)
-    return instance
-
-
-@router.get("/", response_model=schemas.Doctors)
-async def list_doctors(
+async def doctor_filters(
     area_id: Optional[UUID] = Query(None, description="The area ID", example=schemas.UUID_EXAMPLE),
     category_ids: Optional[List[UUID]] = Query([], description="The list of category", example=[schemas.UUID_EXAMPLE]),
+    category_match: str = Query(
+        "any", regex="^(any|all)$", description="The doctors in `any` or in `all` of the categories", example="all"
+    ),
     price_min: condecimal(ge=0, le=100000) = Query(0, description="The min of price range", example=0),
     price_max: condecimal(ge=0, le=100000) = Query(0, description="The max of price range", example=5000),
-) -> Any:
-    language = request_context.language
-
-    # Prepare the filter conditions
+    near: Optional[str] = Query(
+        None,
+        description="Only the doctors around this location (latitude,longitude), nearest first",
+        regex=r"^\s*-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?\s*$",
+        example="22.2783,114.1747",
+    ),
+    radius: float = Query(5, gt=0, le=500, description="The radius in km around `near`", example=5),
+) -> Dict[str, Any]:
+    """
+    Prepare the filter conditions of the doctors
+    """
     filters = dict()
     if area_id:
         filters["area_id"] = area_id
     if category_ids:
         filters["category_id__in"] = category_ids
+        filters["category_match"] = category_match
     if price_min or price_max:
         filters["price__between"] = (min(price_min, price_max), max(price_min, price_max))
+    if near:
+        latitude, longitude = (float(value) for value in near.split(","))
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            raise HTTPException(status_code=422, detail=f"Invalid location {near}")
+        filters["near"] = (latitude, longitude, radius)
+    return filters
+
+
+async def doctor_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma separated fields of the doctors to return, all of them by default",
+        example="id,name,price",
+    ),
+) -> Optional[FrozenSet[str]]:
+    """
+    The sparse fieldset of the doctors
+    """
+    if not fields:
+        return None
+    names = frozenset(name.strip() for name in fields.split(",") if name.strip())
+    if unknown := names - set(schemas.Doctor.__fields__):
+        raise HTTPException(status_code=422, detail=f"Unknown fields {', '.join(sorted(unknown))}")
+    return names
+
+
+async def doctor_languages(
+    languages: List[Language] = Query(
+        [],
+        description="Add the `translations` of the doctors in these languages",
+        example=[Language.English, Language.Chinese],
+    ),
+) -> List[Language]:
+    return list(dict.fromkeys(languages))
+
+
+async def _add_translations(items: List[Any], languages: List[Language]) -> None:
+    """
+    Set the translations map of the doctors (instances or sparse rows), one query for all of them
+    """
+    if not languages or not items:
+        return
+    ids = [item["id"] if isinstance(item, dict) else item.id for item in items]
+    translations = await models.Doctor.get_translations(ids, languages)
+    for id, item in zip(ids, items):
+        if isinstance(item, dict):
+            item["translations"] = translations[id]
+        else:
+            item.translations = translations[id]
+
+
+async def _sparse_response(rows: List[Dict[str, Any]], fields: FrozenSet[str]) -> JSONResponse:
+    if "category_ids" in fields and rows and "category_ids" not in rows[0]:
+        category_ids = await models.DoctorCategory.category_ids_of([row["id"] for row in rows])
+        for row in rows:
+            row["category_ids"] = category_ids[row["id"]]
+    model = schemas.sparse_model(schemas.Doctor, fields)
+    return JSONResponse(jsonable_encoder({"items": [model(**row) for row in rows]}))
+
+
+@router.get("/facets", response_model=schemas.DoctorFacets, dependencies=[Depends(route_timeout(10))])
+async def doctor_facets(
+    filters: Dict[str, Any] = Depends(doctor_filters),
+    price_buckets: List[condecimal(ge=0, le=100000)] = Query(
+        [0, 500, 1000, 2000, 5000], description="The lower bounds of the price buckets", example=[0, 1000, 2000]
+    ),
+) -> Any:
+    return await models.Doctor.facets(
+        filters, language=request_context.language, price_buckets=sorted(set(price_buckets))
+    )
+
+
+def _encode_cursor(watermark: Optional[Tuple[datetime, UUID]]) -> Optional[str]:
+    if watermark is None:
+        return None
+    updated_at, id = watermark
+    return base64.urlsafe_b64encode(json.dumps([updated_at.isoformat(), str(id)]).encode()).decode()
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, UUID]]:
+    if not cursor:
+        return None
+    try:
+        updated_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), UUID(id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor {cursor}") from e
 
-    items = []
-    for instance in await models.Doctor.filter(filters, language=language):
-        items.append(await _process_instance(instance))
+
+@router.get("/changes", response_model=schemas.DoctorChanges)
+async def doctor_changes(
+    since: Optional[str] = Query(None, description="The cursor of the previous call, from the start by default"),
+    limit: int = Query(100, ge=1, le=1000, description="Max number of changes", example=100),
+) -> Any:
+    """
+    The doctors, translations and category links created, updated or deleted since the cursor, oldest first,
+    once they are CHANGES_SAFETY_LAG seconds old. Keep the returned cursor to resume from there, poll again right
+    away while `has_more`
+    """
+    items, watermark, has_more = await models.Doctor.changes(_decode_cursor(since), limit)
+    return {"items": items, "cursor": _encode_cursor(watermark), "has_more": has_more}
+
+
+async def _events(subscription: Subscription) -> AsyncIterator[str]:
+    try:
+        yield f"retry: {settings.SSE_RETRY}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), settings.SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps the proxies from closing the idle connection
+                yield ": ping\n\n"
+                continue
+            if message is None:
+                # Dropped or shutting down, the client reconnects
+                return
+            yield f"data: {message}\n\n"
+    finally:
+        pubsub.unsubscribe(subscription)
+
+
+@router.get("/stream", response_class=StreamingResponse, responses={200: {"content": {"text/event-stream": {}}}})
+async def stream_doctors() -> Response:
+    """
+    Server-sent events of the doctors once they are committed, `{"event": "created|updated|deleted", "id": ...}`,
+    instead of polling the list. The changes missed while disconnected are in /changes
+    """
+    try:
+        subscription = await pubsub.subscribe("doctors")
+    except TooManySubscribers:
+        return overloaded_response()
+    return StreamingResponse(
+        _events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch-get", response_model=schemas.DoctorsBatch)
+async def batch_get_doctors(data: schemas.DoctorBatchGet) -> Any:
+    """
+    Many doctors in one call, in the order of the ids. The missing ones are listed instead of failing the call
+    """
+    ids = list(dict.fromkeys(data.ids))
+    language = request_context.language
+    model = models.DoctorRead if settings.DOCTOR_READ_MODEL else models.Doctor
+    instances = await model.get_many(ids, language=language)
+    items = [instance for instance in instances if instance is not None]
+    if not settings.DOCTOR_READ_MODEL:
+        category_ids = await models.DoctorCategory.category_ids_of([instance.id for instance in items])
+        for instance in items:
+            instance.category_ids = category_ids[instance.id]
+    return {"items": items, "missing": [id for id, instance in zip(ids, instances) if instance is None]}
+
+
+@router.put("/{doctor_id}/translations/{language}", response_model=schemas.DoctorTranslation)
+async def put_doctor_translation(
+    data: schemas.DoctorTranslationUpdate,
+    doctor_id: UUID = Path(..., description="The doctor id", example=schemas.UUID_EXAMPLE),
+    language: Language = Path(..., description="The language of the translation", example=Language.Chinese),
+) -> Any:
+    """
+    Create or replace the translation, idempotent: the doctor is looked up, then the translation is written with
+    one upsert
+    """
+    await _get_or_404(models.Doctor, doctor_id)
+    values = {"doctor_id": doctor_id, "language_code": language.value, **data.dict()}
+    await models.DoctorTranslation.upsert(values, constraint="uq_doctor_id_language_code")
+    return values
+
+
+@router.get("/{doctor_id}", response_model=schemas.Doctor)
+async def retrieve_doctor(
+    doctor_id: UUID = Path(..., description="The doctor id", example=schemas.UUID_EXAMPLE),
+    languages: List[Language] = Depends(doctor_languages),
+) -> Any:
+    if settings.DOCTOR_READ_MODEL:
+        instance = await models.DoctorRead.get(id=doctor_id, language=request_context.language)
+        if not instance:
+            raise HTTPException(status_code=404, detail=f"Doctor is not found {doctor_id}")
+    else:
+        instance = await _get_or_404(models.Doctor, doctor_id, language=request_context.language)
+        instance = await _process_instance(instance)
+    await _add_translations([instance], languages)
+    return instance
+
+
+@router.get("/", response_model=schemas.Doctors, dependencies=[Depends(route_timeout(10))])
+async def list_doctors(
+    filters: Dict[str, Any] = Depends(doctor_filters),
+    fields: Optional[FrozenSet[str]] = Depends(doctor_fields),
+    languages: List[Language] = Depends(doctor_languages),
+) -> Any:
+    language = request_context.language
+    if fields:
+        # Only the asked columns are fetched, the categories and translations only when they are asked
+        model = models.DoctorRead if settings.DOCTOR_READ_MODEL else models.Doctor
+        rows = await model.filter(filters, language=language, fields=fields)
+        if "translations" in fields:
+            await _add_translations(rows, languages)
+        return await _sparse_response(rows, fields)
+    if settings.DOCTOR_READ_MODEL:
+        items = await models.DoctorRead.filter(filters, language=language)
+        await _add_translations(items, languages)
+    else:
+        # Immutable rows, not ORM instances, with the categories and translations of all of them in one query each
+        items = await models.Doctor.filter_rows(filters, language=language, languages=languages)
     return {"items": items}
@@ -1,15 +1,464 @@
+import asyncio
+import cProfile
+import heapq
+import itertools
+import time
+import uuid
+import zlib
+from collections import Counter
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from api.deps import has_debug_access
+from api.profiling import build_report, listen_db_time, profiles
+from core.config import settings
 from core.context import request_context
+from core.db.base import engine, read_engine
+from core.exceptions import overloaded_response
+
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
 
 
 class ContextMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        context_token = request_context.init()
+        context_token = request_context.init(route=f"{request.method} {request.url.path}")
         try:
             response = await call_next(request)
         finally:
             request_context.reset(context_token)
         return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile the request with cProfile when it has the `X-Profile` header or the `profile` query flag, and the
+    access to the debug endpoints. The report (top functions, database and serialisation times) is linked by the
+    `X-Profile` header of the response, held back until the profile is done, except a stream of events.
+    One request is profiled at a time, cProfile sees the whole thread: the concurrent requests are in the profile.
+    Only installed in DEBUG mode or with a debug token.
+    Must be inside ContextMiddleware.
+    """
+
+    HEADER = "x-profile"
+
+    def __init__(self, app: ASGIApp, top: Optional[int] = None) -> None:
+        self.app = app
+        self.top = settings.PROFILE_TOP if top is None else top
+        self._running = False
+        listen_db_time(engine)
+        if read_engine is not engine:
+            listen_db_time(read_engine)
+
+    def _enabled(self, scope: Scope) -> bool:
+        if scope["type"] != "http" or self._running:
+            return False
+        headers = Headers(scope=scope)
+        if self.HEADER not in headers and b"profile=1" not in scope.get("query_string", b"").split(b"&"):
+            return False
+        return has_debug_access(headers.get("x-debug-token"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self._enabled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._running = True
+        profile: Dict[str, Any] = {"db_time": 0.0, "db_statements": 0}
+        request_context.state.profile = profile
+        profiler = cProfile.Profile()
+        profile_id = uuid.uuid4().hex
+        body: List[Message] = []
+        streaming = False
+
+        async def _send(message: Message) -> None:
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Profile"] = f"/api/debug/profiles/{profile_id}"
+                # The events can't wait for the end of the stream, its profile is linked before it's done
+                streaming = headers.get("content-type", "").startswith("text/event-stream")
+            if streaming:
+                await send(message)
+            else:
+                # Held back until the profile is done, so it's there once the response is
+                body.append(message)
+
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            profiler.disable()
+            self._running = False
+            request_context.state.profile = None
+        duration = time.perf_counter() - start
+
+        report, dump = build_report(
+            profiler,
+            f"{scope['method']} {scope['path']}",
+            duration,
+            profile["db_time"],
+            profile["db_statements"],
+            self.top,
+            profile_id,
+        )
+        profiles.add(report, dump)
+        for message in body:
+            await send(message)
+
+
+def request_timeout(headers: Headers, default: float) -> float:
+    """
+    The timeout asked by the client in the header, capped by the max, else the default
+    """
+    try:
+        timeout = float(headers[settings.REQUEST_TIMEOUT_HEADER])
+    except (KeyError, ValueError):
+        return default
+    return min(timeout, settings.REQUEST_TIMEOUT_MAX) if timeout > 0 else default
+
+
+class DeadlineMiddleware:
+    """
+    Give every request a deadline (see `request_timeout`) and cancel it when the client disconnects before
+    the response is sent: the deadline is expired so the running statement is interrupted, and the handler is
+    cancelled so its connection goes back to the pool right away.
+    Must be inside ContextMiddleware.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_context.set_deadline(request_timeout(Headers(scope=scope), settings.REQUEST_TIMEOUT))
+        queue: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=1)
+        disconnected = asyncio.Event()
+        response_started = response_complete = False
+
+        async def watch_disconnect() -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    if not response_complete:
+                        request_context.state.deadline = 0
+                        app_task.cancel()
+                    return
+                await queue.put(message)
+
+        async def _receive() -> Message:
+            if disconnected.is_set() and queue.empty():
+                return {"type": "http.disconnect"}
+            getter = asyncio.ensure_future(queue.get())
+            waiter = asyncio.ensure_future(disconnected.wait())
+            await asyncio.wait((getter, waiter), return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if getter.done():
+                return getter.result()
+            getter.cancel()
+            return {"type": "http.disconnect"}
+
+        async def _send(message: Message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, _receive, _send))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected.is_set():
+                raise
+            if not response_started:
+                # Nobody will read it, 499 is the de facto "client closed request"
+                await Response(status_code=499)(scope, receive, send)
+        finally:
+            watcher.cancel()
+
+
+class PriorityLimiter:
+    """
+    Concurrency limit with a bounded wait queue per priority, a freed slot goes to the lowest priority value first
+    """
+
+    def __init__(self, limit: int, max_queue: int) -> None:
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued: Counter = Counter()
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """
+        Wait for a slot, False when the queue of the priority is full or the wait is over the timeout
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if self._queued[priority] >= self.max_queue:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            # The slot may have been handed over right at the timeout
+            if future.done():
+                return True
+            future.cancel()
+            return False
+        except asyncio.CancelledError:
+            if future.done():
+                self.release()
+            future.cancel()
+            raise
+        finally:
+            self._queued[priority] -= 1
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot over, the active count doesn't change
+                future.set_result(True)
+                return
+        self.active -= 1
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed the load early instead of piling the requests up in front of the database pool: at most `limit`
+    requests run at once, the others wait in a bounded queue and get a 503 with Retry-After when the queue
+    is full or they waited more than `max_wait` seconds.
+    The exempt paths (the health check) are never queued and the writes are served before the reads.
+    """
+
+    WRITE, READ = 0, 1
+    READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limit: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        exempt_paths: Optional[List[str]] = None,
+    ) -> None:
+        self.app = app
+        self.limiter = PriorityLimiter(
+            settings.ADMISSION_MAX_CONCURRENCY if limit is None else limit,
+            settings.ADMISSION_MAX_QUEUE if max_queue is None else max_queue,
+        )
+        self.max_wait = settings.ADMISSION_MAX_WAIT if max_wait is None else max_wait
+        self.exempt_paths = set(settings.ADMISSION_EXEMPT_PATHS if exempt_paths is None else exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.READ if scope["method"] in self.READ_METHODS else self.WRITE
+        if not await self.limiter.acquire(priority, self.max_wait):
+            response = overloaded_response()
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+class _Compressor:
+    """
+    Streaming compressor, `compress` returns the data that can be sent right away for every chunk
+    """
+
+    def __init__(self, encoding: str, level: int) -> None:
+        if encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._compress = compressor.compress
+            self._flush = partial(compressor.flush, zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            self._finish = compressor.flush
+        elif encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self._compress = compressor.process
+            self._flush = compressor.flush
+            self._finish = compressor.finish
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress = compressor.compress
+            self._flush = partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+            self._finish = compressor.flush
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        return self._compress(data) + (self._finish() if last else self._flush())
+
+
+def _levels() -> Dict[str, int]:
+    levels = {"gzip": settings.COMPRESSION_GZIP_LEVEL}
+    if brotli is not None:
+        levels["br"] = settings.COMPRESSION_BROTLI_LEVEL
+    if zstandard is not None:
+        levels["zstd"] = settings.COMPRESSION_ZSTD_LEVEL
+    return levels
+
+
+def negotiate_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """
+    Pick the encoding with the highest q-value, on a tie the order of `available` is the preference
+    """
+    best, best_quality = None, 0.0
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        candidates = available if name == "*" else [name]
+        for candidate in candidates:
+            if candidate not in available or quality <= 0:
+                continue
+            if quality > best_quality or (
+                quality == best_quality and available.index(candidate) < available.index(best)
+            ):
+                best, best_quality = candidate, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress the responses with zstd, brotli or gzip, whichever the client prefers and is installed.
+    Bodies under `minimum_size` are sent as is, streaming responses are compressed chunk by chunk
+    and the chunks above `thread_threshold` are compressed in a worker thread to keep the event loop free.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: Optional[int] = None,
+        thread_threshold: Optional[int] = None,
+        levels: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MINIMUM_SIZE if minimum_size is None else minimum_size
+        self.thread_threshold = settings.COMPRESSION_THREAD_THRESHOLD if thread_threshold is None else thread_threshold
+        self.levels = levels or _levels()
+        self.encodings = [encoding for encoding in ("zstd", "br", "gzip") if encoding in self.levels]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+            if encoding:
+                responder = _CompressionResponder(self, encoding)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send: Send = _unattached_send
+        self.initial_message: Message = {}
+        self.buffer: List[bytes] = []
+        self.buffer_size = 0
+        self.passthrough = False
+        self.compressor: Optional[_Compressor] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.middleware.app(scope, receive, self.send_compressed)
+
+    async def _compress(self, body: bytes, last: bool) -> bytes:
+        compress: Callable[..., bytes] = self.compressor.compress
+        if len(body) >= self.middleware.thread_threshold:
+            return await anyio.to_thread.run_sync(compress, body, last)
+        return compress(body, last)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Don't send the initial message until we know if the body will be compressed
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            # The events can't wait in the buffer for the minimum size
+            self.passthrough = "content-encoding" in headers or headers.get("content-type", "").startswith(
+                "text/event-stream"
+            )
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is not None:
+            await self.send({**message, "body": await self._compress(body, last=not more_body)})
+            return
+        if self.passthrough:
+            # Already encoded, e.g. the precompressed openapi schema, or a stream of events
+            if self.initial_message:
+                await self.send(self.initial_message)
+                self.initial_message = {}
+            await self.send(message)
+            return
+
+        # Buffer the first chunks of a stream until the body is known to be above the minimum size
+        self.buffer.append(body)
+        self.buffer_size += len(body)
+        if more_body and self.buffer_size < self.middleware.minimum_size:
+            return
+        body = b"".join(self.buffer)
+        self.buffer = []
+        if not more_body and self.buffer_size < self.middleware.minimum_size:
+            await self.send(self.initial_message)
+            await self.send({**message, "body": body})
+            return
+
+        self.compressor = _Compressor(self.encoding, self.middleware.levels[self.encoding])
+        body = await self._compress(body, last=not more_body)
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        await self.send(self.initial_message)
+        await self.send({**message, "body": body})
+
+
+async def _unattached_send(message: Message) -> Any:
+    raise RuntimeError("send awaitable not set")  # pragma: no cover
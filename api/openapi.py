@@ -0,0 +1,71 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import FastAPI
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def encode_openapi(schema: Dict[str, Any]) -> bytes:
+    """
+    Same encoding as the JSONResponse of FastAPI, so the artifact is byte for byte the served schema
+    """
+    return json.dumps(schema, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class OpenAPIArtifact:
+    """
+    The OpenAPI schema encoded and compressed once, served as is for every request
+    """
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+        self.gzip_content = gzip.compress(content, compresslevel=9)
+        self.etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+    @classmethod
+    def from_file(cls, path: str) -> Optional["OpenAPIArtifact"]:
+        file = Path(path)
+        if not file.is_file():
+            return None
+        return cls(file.read_bytes())
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": "public, max-age=0, must-revalidate", "Vary": "Accept-Encoding"}
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip_content, media_type="application/json", headers=headers)
+        return Response(self.content, media_type="application/json", headers=headers)
+
+
+def setup_openapi(app: FastAPI, path: Optional[str] = None) -> Callable[[], Awaitable[None]]:
+    """
+    Replace the openapi route of the app, the schema is loaded from the artifact built by `scripts/openapi.py`
+    or generated once per worker when there is no artifact.
+    Returns the warm-up that generates it ahead of the first request.
+    """
+    artifact = OpenAPIArtifact.from_file(path) if path else None
+    if artifact:
+        app.openapi_schema = json.loads(artifact.content)
+
+    def get_artifact() -> OpenAPIArtifact:
+        nonlocal artifact
+        if artifact is None:
+            artifact = OpenAPIArtifact(encode_openapi(app.openapi()))
+        return artifact
+
+    async def openapi(request: Request) -> Response:
+        return get_artifact().response(request)
+
+    async def build_openapi() -> None:
+        get_artifact()
+
+    app.router.routes = [route for route in app.router.routes if getattr(route, "path", None) != app.openapi_url]
+    app.add_route(app.openapi_url, openapi, include_in_schema=False)
+    return build_openapi
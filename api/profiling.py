@@ -0,0 +1,113 @@
+import collections
+import cProfile
+import marshal
+import pstats
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.config import settings
+from core.context import request_context
+
+
+# (file, function) of the JSON serialisation of the responses
+SERIALISATION_FUNCTIONS = {("fastapi/routing.py", "serialize_response"), ("starlette/responses.py", "render")}
+
+# (file, line, function) -> (primitive calls, calls, total time, cumulative time, callers)
+StatsTable = Dict[Tuple[str, int, str], Tuple[int, int, float, float, Dict[Any, Any]]]
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    request = request_context.current()
+    if request is not None and request.profile is not None:
+        context.profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    start = getattr(context, "profile_start", None)
+    request = request_context.current()
+    if start is not None and request is not None and request.profile is not None:
+        profile = request.profile
+        profile["db_time"] += time.perf_counter() - start
+        profile["db_statements"] += 1
+
+
+def listen_db_time(engine: AsyncEngine) -> None:
+    """
+    Time the statements of the profiled requests
+    """
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _stats_table(stats: pstats.Stats) -> StatsTable:
+    # Not in the stubs of pstats
+    return cast(StatsTable, getattr(stats, "stats"))
+
+
+def build_report(
+    profiler: cProfile.Profile,
+    route: str,
+    duration: float,
+    db_time: float,
+    db_statements: int,
+    top: int,
+    profile_id: Optional[str] = None,
+) -> Tuple[Dict[str, Any], bytes]:
+    """
+    The summary of the profile and its raw pstats dump, loadable with `pstats.Stats` or snakeviz
+    """
+    table = _stats_table(pstats.Stats(profiler))
+    functions: List[Dict[str, Any]] = []
+    serialisation_time = 0.0
+    for (filename, line, name), (_, calls, total_time, cumulative_time, _) in table.items():
+        if any(filename.endswith(file) and name == function for file, function in SERIALISATION_FUNCTIONS):
+            serialisation_time += cumulative_time
+        functions.append(
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "total_time": total_time,
+                "cumulative_time": cumulative_time,
+            }
+        )
+    functions.sort(key=lambda item: item["cumulative_time"], reverse=True)
+    report = {
+        "id": profile_id or uuid.uuid4().hex,
+        "route": route,
+        "duration": duration,
+        "db_time": db_time,
+        "db_statements": db_statements,
+        "serialisation_time": serialisation_time,
+        "functions": functions[:top],
+    }
+    return report, marshal.dumps(table)
+
+
+class ProfileStore:
+    """
+    The last profiles of the worker, the oldest one is dropped past `size`
+    """
+
+    def __init__(self, size: Optional[int] = None) -> None:
+        self.size = settings.PROFILE_STORE_SIZE if size is None else size
+        self._profiles: "collections.OrderedDict[str, Tuple[Dict[str, Any], bytes]]" = collections.OrderedDict()
+
+    def add(self, report: Dict[str, Any], dump: bytes) -> None:
+        self._profiles[report["id"]] = (report, dump)
+        while len(self._profiles) > self.size:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        return self._profiles.get(profile_id)
+
+
+profiles = ProfileStore()
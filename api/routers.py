@@ -1,9 +1,15 @@
 from fastapi import APIRouter
 
-from api.endpoints import doctors
+from api.endpoints import admin, debug, doctors
 
 
 api_router = APIRouter()
 
 # Doctors
 api_router.include_router(doctors.router, prefix="/doctors", tags=["Doctors"])
+
+# Admin, set-based writes
+api_router.include_router(admin.router, prefix="/admin", tags=["Admin"])
+
+# Debug, only in DEBUG mode or with the debug token
+api_router.include_router(debug.router, prefix="/debug", tags=["Debug"], include_in_schema=False)
@@ -0,0 +1,113 @@
+"""
+Warm-up of a new worker, in the background of the startup: the health check reports it not ready until the pool
+connections are open, the statements of the hot paths are compiled and the OpenAPI schema is built, so the first
+requests after a deploy don't pay for them
+"""
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional
+
+import models
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import QueuePool
+
+from core.config import Language, settings
+from core.context import request_context
+from core.db.base import async_session
+
+
+logger = logging.getLogger(__name__)
+
+WarmUp = Callable[[], Awaitable[None]]
+
+# Nothing has this id, the lookups of the warm-up find nothing
+NIL_ID = uuid.UUID(int=0)
+
+
+async def open_connections(async_engine: AsyncEngine, count: Optional[int] = None) -> int:
+    """
+    Open `count` connections of the pool at once (its size by default), the pool keeps them once they are returned.
+    Returns the number of opened connections, none without a pool (NullPool of the SQLite file databases)
+    """
+    pool = async_engine.sync_engine.pool
+    if not isinstance(pool, QueuePool):
+        return 0
+    count = pool.size() if count is None else min(count, pool.size())
+    async with contextlib.AsyncExitStack() as stack:
+        for _ in range(count):
+            connection = await stack.enter_async_context(async_engine.connect())
+            await connection.exec_driver_sql("SELECT 1")
+    return count
+
+
+async def compile_statements() -> None:
+    """
+    Run the statements of the hot paths once so the engines cache their compiled form: the doctor get and list
+    (the filters of a nil id, nothing is read) and the create, in a transaction that is rolled back
+    """
+    request_context.init()
+    db = async_session()
+    request_context.set("db", db)
+    try:
+        for language in Language:
+            await models.Doctor.get(id=NIL_ID, language=language)
+        await models.Doctor.get(id=NIL_ID)
+        await models.Doctor.get_many([NIL_ID], language=Language.English)
+        for filters in ({"area_id": NIL_ID}, {"category_id__in": [NIL_ID], "category_match": "any"}):
+            await models.Doctor.filter_rows(filters, language=Language.English)
+            if settings.DOCTOR_READ_MODEL:
+                await models.DoctorRead.filter(filters, language=Language.English)
+
+        area_id = (await db.execute(sa.select(models.Area.id).limit(1))).scalar()
+        category_id = (await db.execute(sa.select(models.Category.id).limit(1))).scalar()
+        if area_id is not None and category_id is not None:
+            values = {"area_id": area_id, "name": "", "category_ids": [category_id]}
+            await models.Doctor.create(values, language=Language.English, commit=False)
+        await db.rollback()
+    finally:
+        await db.close()
+
+
+class Readiness:
+    """
+    Runs the warm-ups one after the other, each one is retried every `retry` seconds until it succeeds,
+    then the worker is ready. A warm-up still failing after `attempts` is skipped with an error, they only save
+    the first requests some time: the worker isn't kept out of the load balancer forever
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self, warm_ups: List[WarmUp], retry: float, attempts: int) -> None:
+        self.ready = False
+        self.task = asyncio.get_running_loop().create_task(self.run(warm_ups, retry, attempts))
+
+    async def run(self, warm_ups: List[WarmUp], retry: float, attempts: int) -> None:
+        started_at = time.perf_counter()
+        for warm_up in warm_ups:
+            for attempt in range(1, attempts + 1):
+                try:
+                    await warm_up()
+                    break
+                except Exception:  # pylint: disable=W0703
+                    if attempt == attempts:
+                        logger.exception("Warm-up %s failed %s times, skipped", warm_up.__name__, attempts)
+                        break
+                    logger.exception("Warm-up %s failed, retrying in %ss", warm_up.__name__, retry)
+                    await asyncio.sleep(retry)
+        self.ready = True
+        logger.info("Warmed up in %.3fs", time.perf_counter() - started_at)
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+
+
+readiness = Readiness()
@@ -0,0 +1,80 @@
+"""
+Measure the import time of the app (the cold start of every worker) with `python -X importtime`
+
+    python benchmarks/import_time.py --runs 5 --max-ms 800
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+root = Path(__file__).resolve().parents[1]
+
+# Modules that are only needed by the scripts and the tests, never by a running worker
+FORBIDDEN_MODULES = ("faker",)
+
+
+def measure(module: str) -> Dict[str, int]:
+    """
+    Import the module in a fresh interpreter, return the cumulative import time (us) of each module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        try:
+            timings[name.strip()] = int(cumulative)
+        except ValueError:
+            # The header line
+            continue
+    return timings
+
+
+def run(module: str, runs: int) -> Tuple[List[float], Dict[str, int]]:
+    totals = []
+    timings: Dict[str, int] = {}
+    for _ in range(runs):
+        timings = measure(module)
+        totals.append(timings[module] / 1000)
+    return totals, timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="The module to import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Show the slowest N modules")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail when the median import time is above")
+    args = parser.parse_args()
+
+    totals, timings = run(args.module, args.runs)
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.1f}ms, min {min(totals):.1f}ms, max {max(totals):.1f}ms")
+    print(f"\nSlowest {args.top} modules (cumulative, last run):")
+    for name, cumulative in sorted(timings.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"{cumulative / 1000:10.1f}ms  {name}")
+
+    failed = False
+    forbidden = [name for name in timings if name.split(".")[0] in FORBIDDEN_MODULES]
+    if forbidden:
+        print(f"\nForbidden modules imported: {', '.join(sorted(forbidden))}")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nMedian import time {median:.1f}ms is above {args.max_ms}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
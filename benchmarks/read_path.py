@@ -0,0 +1,158 @@
+# pylint: disable=E402
+"""
+Rows per second and memory of the doctor list: ORM instances (Doctor.filter, the categories in one query)
+vs immutable rows (Doctor.filter_rows), fetched only and validated by the response model
+
+    python benchmarks/read_path.py --rows 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+directory = tempfile.TemporaryDirectory()
+# The engine is created from the settings on import
+os.environ["DB_DATABASE"] = os.path.join(directory.name, "read_path.db")
+os.environ["DB_SQLITE_WAL"] = "false"
+
+import models
+import schemas
+import sqlalchemy as sa
+
+from core.config import Language
+from core.context import request_context
+from core.db.base import Base, async_session, engine
+from core.db.models import utcnow
+from core.db.types import default_uuid
+
+
+async def seed(rows: int) -> Dict[str, Any]:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        now = utcnow()
+        area_id, category_ids = default_uuid(), [default_uuid(), default_uuid()]
+        await conn.execute(sa.insert(models.Area.__table__), [{"id": area_id, "created_at": now, "updated_at": now}])
+        await conn.execute(
+            sa.insert(models.Category.__table__),
+            [{"id": id, "created_at": now, "updated_at": now} for id in category_ids],
+        )
+        working_hours = {
+            day: {"is_available": True, "time_start_at": "09:00:00", "time_end_at": "17:00:00"}
+            for day in schemas.WorkingHours.__fields__
+        }
+        doctors, translations, links = [], [], []
+        for index in range(rows):
+            doctor_id = default_uuid()
+            doctors.append(
+                {
+                    "id": doctor_id,
+                    "area_id": area_id,
+                    "price": index % 5000,
+                    "phone_number": "18066048764",
+                    "working_hours": working_hours,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            translations.append(
+                {
+                    "id": default_uuid(),
+                    "doctor_id": doctor_id,
+                    "language_code": Language.English.value,
+                    "name": f"Doctor {index}",
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            links.append(
+                {
+                    "id": default_uuid(),
+                    "doctor_id": doctor_id,
+                    "category_id": category_ids[index % 2],
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+        await conn.execute(sa.insert(models.Doctor.__table__), doctors)
+        await conn.execute(sa.insert(models.DoctorTranslation.__table__), translations)
+        await conn.execute(sa.insert(models.DoctorCategory.__table__), links)
+    return {"area_id": area_id}
+
+
+async def orm_instances(filters: Dict[str, Any]) -> List[Any]:
+    instances = await models.Doctor.filter(filters, language=Language.English)
+    category_ids = await models.DoctorCategory.category_ids_of([instance.id for instance in instances])
+    for instance in instances:
+        instance.category_ids = category_ids[instance.id]
+    return instances
+
+
+async def immutable_rows(filters: Dict[str, Any]) -> List[Any]:
+    return await models.Doctor.filter_rows(filters, language=Language.English)
+
+
+async def measure(fetch: Callable[[Dict[str, Any]], Awaitable[List[Any]]], filters: Dict[str, Any], validate: bool):
+    """
+    Seconds to fetch (and validate), and the memory still held by the items and the session once done
+    """
+    request_context.init()
+    db = async_session()
+    request_context.set("db", db)
+    try:
+        started_at = time.perf_counter()
+        items = await fetch(filters)
+        if validate:
+            schemas.Doctors(items=items)
+        elapsed = time.perf_counter() - started_at
+    finally:
+        await db.close()
+
+    request_context.init()
+    db = async_session()
+    request_context.set("db", db)
+    try:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        items = await fetch(filters)
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    finally:
+        await db.close()
+    return elapsed, held, len(items)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    filters = await seed(args.rows)
+    for validate in (False, True):
+        for fetch in (orm_instances, immutable_rows):
+            # Warm up: the compiled statements are cached
+            await measure(fetch, filters, validate)
+            results = [await measure(fetch, filters, validate) for _ in range(args.repeat)]
+            elapsed = min(result[0] for result in results)
+            held = min(result[1] for result in results)
+            count = results[0][2]
+            name = fetch.__name__ + (" + response model" if validate else "")
+            print(
+                f"{name:35}: {count / elapsed:10.0f} rows/s, "
+                f"{held / count * 10_000 / 1024 / 1024:6.1f}MB per 10k rows held"
+            )
+    await engine.dispose()
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# pylint: disable=E402
+"""
+Overhead of the request context per request: the slotted state of core.context vs the dict it replaces (reproduced
+below), time of a request (init, the sets of the middlewares and dependencies, the lookups of the hooks of each
+statement, reset) and size of one state
+
+    python benchmarks/request_context.py --requests 100000 --statements 20
+"""
+import argparse
+import sys
+import time
+from contextvars import ContextVar, copy_context
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from core.config import Language
+from core.context import RequestState, request_context
+
+
+_dict_context: ContextVar[Any] = ContextVar("_dict_context", default={})
+
+
+class DictContext:
+    """
+    The former request context: a dict per request
+    """
+
+    @staticmethod
+    def exists() -> bool:
+        return _dict_context in copy_context()
+
+    @staticmethod
+    def init() -> Any:
+        return _dict_context.set({})
+
+    @staticmethod
+    def get(key: str) -> Optional[Any]:
+        return _dict_context.get().get(key, None)
+
+    @staticmethod
+    def set(key: str, value: Any) -> None:
+        _dict_context.get()[key] = value
+
+    @staticmethod
+    def reset(token: Any) -> None:
+        _dict_context.reset(token)
+
+    @staticmethod
+    def set_deadline(timeout: float) -> None:
+        _dict_context.get()["deadline"] = time.monotonic() + timeout
+
+    @staticmethod
+    def remaining() -> Optional[float]:
+        deadline = _dict_context.get().get("deadline")
+        return None if deadline is None else deadline - time.monotonic()
+
+
+dict_context = DictContext()
+
+
+def dict_request(statements: int) -> None:
+    token = dict_context.init()
+    dict_context.set("route", "GET /api/doctors/")
+    dict_context.set_deadline(30)
+    dict_context.set("language", Language.English)
+    dict_context.set("db", None)
+    dict_context.get("db")
+    for _ in range(statements):
+        # The deadline and profiling hooks
+        if dict_context.exists():
+            dict_context.remaining()
+        if dict_context.exists():
+            dict_context.get("profile")
+    dict_context.reset(token)
+
+
+def slotted_request(statements: int) -> None:
+    # As ContextMiddleware, route_timeout, check_language_code, init_db and get_db
+    token = request_context.init(route="GET /api/doctors/")
+    request_context.set_deadline(30)
+    request_context.state.language = Language.English
+    request_context.state.db = None
+    _ = request_context.state.db
+    for _ in range(statements):
+        request = request_context.current()
+        if request is not None and request.deadline is not None:
+            _ = request.deadline - time.monotonic()
+        request = request_context.current()
+        if request is not None:
+            _ = request.profile
+    request_context.reset(token)
+
+
+def state_size(create: Callable[[], Any]) -> int:
+    # tracemalloc misses the dicts reused from the free list of the interpreter
+    return sys.getsizeof(create())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--statements", type=int, default=20, help="Statements of each request")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    def dict_state() -> Dict[str, Any]:
+        return {"route": "GET /api/doctors/", "deadline": 0.0, "language": Language.English, "db": None}
+
+    def slotted_state() -> RequestState:
+        return RequestState(route="GET /api/doctors/", deadline=0.0)
+
+    for name, request, create in (
+        ("dict (former)", dict_request, dict_state),
+        ("slotted (core.context)", slotted_request, slotted_state),
+    ):
+        timings = []
+        for _ in range(args.repeat):
+            started_at = time.perf_counter()
+            for _ in range(args.requests):
+                request(args.statements)
+            timings.append(time.perf_counter() - started_at)
+        print(
+            f"{name:22}: {min(timings) / args.requests * 1e6:6.2f}us per request, "
+            f"{state_size(create):4d} bytes per state"
+        )
+
+
+if __name__ == "__main__":
+    main()
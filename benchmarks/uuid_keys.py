@@ -0,0 +1,73 @@
+# pylint: disable=E402
+"""
+Insert throughput and index size of the doctors table with random (uuid4) vs time-ordered (uuid7) primary keys
+
+    python benchmarks/uuid_keys.py --rows 1000000 --batch-size 10000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict
+
+
+root = Path(__file__).resolve().parents[1]
+sys.path.append(str(root))
+
+from models import Doctor
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+
+from core.db.types import uuid7
+
+
+GENERATORS: Dict[str, Callable[[], uuid.UUID]] = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+def run(name: str, rows: int, batch_size: int, directory: str) -> None:
+    path = os.path.join(directory, f"{name}.db")
+    connection = sqlite3.connect(path)
+    # Same table and primary key index as the app, the keys are stored as hex by the UUID type
+    connection.execute(str(CreateTable(Doctor.__table__).compile(dialect=sqlite.dialect())))
+    generate = GENERATORS[name]
+    area_id = uuid.uuid4().hex
+    insert = "INSERT INTO doctors (id, area_id, created_at, updated_at) VALUES (?, ?, '', '')"
+
+    started_at = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        size = min(batch_size, rows - offset)
+        connection.executemany(insert, ((generate().hex, area_id) for _ in range(size)))
+        connection.commit()
+    elapsed = time.perf_counter() - started_at
+
+    page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    try:
+        index_pages = connection.execute(
+            "SELECT count(*) FROM dbstat WHERE name = 'sqlite_autoindex_doctors_1'"
+        ).fetchone()[0]
+        index_size = f"{index_pages * page_size / 1024 / 1024:8.1f}MB"
+    except sqlite3.OperationalError:
+        # SQLite built without dbstat
+        index_size = "     n/a"
+    connection.close()
+    file_size = os.path.getsize(path) / 1024 / 1024
+    print(f"{name}: {rows / elapsed:10.0f} rows/s, index {index_size}, database {file_size:8.1f}MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in GENERATORS:
+            run(name, args.rows, args.batch_size, directory)
+
+
+if __name__ == "__main__":
+    main()
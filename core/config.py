@@ -1,5 +1,5 @@
 import enum
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseSettings
 from sqlalchemy.engine.url import URL
@@ -19,6 +19,8 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "Necktie"
     DEBUG: bool = False
     VERSION: str = "1.0.0"
+    # The OpenAPI schema artifact built by `scripts/openapi.py`, generated by each worker when it's not set
+    OPENAPI_FILE: str = ""
 
     DB_DRIVER: str = "sqlite+aiosqlite"
     DB_HOST: str = ""
@@ -29,8 +31,79 @@ class Settings(BaseSettings):
 
     DB_POOL_SIZE: int = 5
     DB_MAX_OVERFLOW: int = 0
+    # Seconds to wait for a pooled connection before the request is rejected with a 503
+    DB_POOL_TIMEOUT: float = 5
     DB_ECHO: bool = False
 
+    # SQLite production mode: WAL journal, read-only connection pool and a single writer connection
+    DB_SQLITE_WAL: bool = False
+    DB_SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    # Negative value is the cache size in KiB
+    DB_SQLITE_CACHE_SIZE: int = -64000
+    DB_SQLITE_BUSY_TIMEOUT: int = 15000
+
+    # Serve the doctors from the denormalised read model (doctors_read)
+    DOCTOR_READ_MODEL: bool = False
+
+    # Admission control: concurrent requests per worker, queued requests per priority and their max wait (s)
+    ADMISSION_MAX_CONCURRENCY: int = 64
+    ADMISSION_MAX_QUEUE: int = 128
+    ADMISSION_MAX_WAIT: float = 2
+    ADMISSION_RETRY_AFTER: int = 1
+    # The event stream holds its connection for ever, it's bounded by PUBSUB_MAX_SUBSCRIBERS instead
+    ADMISSION_EXEMPT_PATHS: List[str] = ["/", "/api/doctors/stream"]
+
+    # Request deadline (s), the client can ask for another one with the header up to the max
+    REQUEST_TIMEOUT: float = 30
+    REQUEST_TIMEOUT_MAX: float = 60
+    REQUEST_TIMEOUT_HEADER: str = "X-Request-Timeout"
+    # The change feed only serves the changes older than this (s): updated_at is set at the flush, a transaction
+    # committed later could hide behind the cursor of a reader otherwise. Above REQUEST_TIMEOUT_MAX, the longest
+    # transaction of a request. The seeding script and the data migrations can hold one longer, not covered
+    CHANGES_SAFETY_LAG: float = 90
+    # SQLite VM instructions between two deadline checks of a running statement
+    DB_SQLITE_PROGRESS_STEPS: int = 1000
+
+    # Slow-query log: statements over the threshold (s) are logged with their plan, once per rate limit (s)
+    SLOW_QUERY_LOG: bool = False
+    SLOW_QUERY_THRESHOLD: float = 0.5
+    SLOW_QUERY_RATE_LIMIT: float = 60
+    SLOW_QUERY_LOG_SIZE: int = 100
+
+    # Grants the access to the debug endpoints when DEBUG is off, with the X-Debug-Token header
+    DEBUG_TOKEN: str = ""
+    # Grants the access to the admin endpoints with the X-Admin-Token header, they are closed without it
+    ADMIN_TOKEN: str = ""
+    # Profiling of the requests with the X-Profile header: functions in the report, reports kept per worker
+    PROFILE_TOP: int = 30
+    PROFILE_STORE_SIZE: int = 20
+
+    # Server-sent events: broker (module:Class) carrying the events to every worker, messages queued per
+    # subscriber before it's dropped, subscribers per worker, heartbeat (s) and reconnection delay (ms)
+    PUBSUB_BROKER: str = "core.pubsub:LocalBroker"
+    PUBSUB_QUEUE_SIZE: int = 100
+    PUBSUB_MAX_SUBSCRIBERS: int = 1000
+    SSE_HEARTBEAT: float = 15
+    SSE_RETRY: int = 3000
+
+    # Warm-up of the workers before they are reported ready: connections opened per pool (its size by default),
+    # the delay (s) before retrying a failed step and its attempts before it's skipped
+    WARMUP: bool = True
+    WARMUP_CONNECTIONS: Optional[int] = None
+    WARMUP_RETRY: float = 5
+    WARMUP_ATTEMPTS: int = 12
+
+    # Data migrations (core.db.data_migrations): rows per batch and commit, max rows per second (unthrottled if unset)
+    DATA_MIGRATION_BATCH_SIZE: int = 1000
+    DATA_MIGRATION_RATE: Optional[float] = None
+
+    # Response compression, the levels are per encoding since their ranges are different
+    COMPRESSION_MINIMUM_SIZE: int = 500
+    COMPRESSION_THREAD_THRESHOLD: int = 64 * 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_LEVEL: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
     @property
     def DB_DSN(self) -> URL:
         return URL.create(
@@ -42,6 +115,21 @@ class Settings(BaseSettings):
             self.DB_DATABASE,
         )
 
+    @property
+    def DB_READ_DSN(self) -> URL:
+        """
+        Read-only connections of the SQLite database, the writes will be rejected by SQLite itself
+        """
+        return URL.create(
+            self.DB_DRIVER,
+            database=f"file:{self.DB_DATABASE}",
+            query={"mode": "ro", "uri": "true"},
+        )
+
+    @property
+    def IS_SQLITE(self) -> bool:
+        return self.DB_DRIVER.startswith("sqlite")
+
     class Config:
         case_sensitive = True
 
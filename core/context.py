@@ -1,57 +1,116 @@
-import copy
-from typing import Any, Dict, NoReturn, Optional, cast
+import time
+from typing import Any, Dict, Optional
 
-from _contextvars import ContextVar, Token, copy_context
+from _contextvars import ContextVar, Token
 
 from core.config import Language
 
 
-_context: ContextVar[Any] = ContextVar("_request_context", default={})
+class RequestState:
+    """
+    The state of a request, a new one for each request: the known keys are slots, fast to read and
+    nothing else can be stored
+    """
+
+    __slots__ = ("db", "language", "route", "deadline", "profile")
+
+    def __init__(self, **values: Any) -> None:
+        self.db: Any = None
+        self.language: Language = Language.English
+        # "METHOD path" of the request
+        self.route: Optional[str] = None
+        # time.monotonic() deadline
+        self.deadline: Optional[float] = None
+        # The database time and statements of a profiled request
+        self.profile: Optional[Dict[str, Any]] = None
+        for key, value in values.items():
+            setattr(self, key, value)
+
+
+# No default: a shared default state would leak between the requests
+_context: ContextVar[RequestState] = ContextVar("_request_context")
+
+
+_MISSING = "Please add ContextMiddleware to use this feature"
+
+
+def _state() -> RequestState:
+    try:
+        return _context.get()
+    except LookupError as ex:
+        raise RuntimeError(_MISSING) from ex
 
 
 class _Context:
-    def __setattr__(self, key: str, value: Any) -> NoReturn:
-        _context.get()[key] = value
+    def __setattr__(self, key: str, value: Any) -> None:
+        setattr(_state(), key, value)
 
     @property
-    def data(self) -> Dict[str, Any]:
+    def state(self) -> RequestState:
         """
-        Dump this to json. Object itself it not serializable.
+        The state of the request, its attributes are read and set directly by the hot paths (no get/set by name)
         """
-        try:
-            return cast(Dict[str, Any], _context.get())
-        except LookupError as ex:
-            raise RuntimeError("Please add ContextMiddle to use this feature") from ex
+        return _state()
 
     @staticmethod
     def exists() -> bool:
-        return _context in copy_context()
+        return _context.get(None) is not None
+
+    @staticmethod
+    def current() -> Optional[RequestState]:
+        """
+        The state of the request, None outside of a request: a single lookup for the hooks of every statement
+        """
+        return _context.get(None)
 
     def copy(self) -> Dict[str, Any]:
         """
         Read only context data.
         """
-        return copy.copy(self.data)
+        state = _state()
+        return {key: getattr(state, key) for key in RequestState.__slots__}
 
     @staticmethod
-    def init(data: Dict[str, Any] = {}) -> Token:
-        return _context.set(data)
+    def init(**values: Any) -> Token:
+        # A new state for every request
+        return _context.set(RequestState(**values))
 
     @staticmethod
     def get(key: str) -> Optional[Any]:
-        return _context.get().get(key, None)
+        try:
+            return getattr(_context.get(), key)
+        except LookupError as ex:
+            raise RuntimeError(_MISSING) from ex
 
     @staticmethod
-    def set(key: str, value: Any) -> NoReturn:
-        _context.get()[key] = value
+    def set(key: str, value: Any) -> None:
+        try:
+            setattr(_context.get(), key, value)
+        except LookupError as ex:
+            raise RuntimeError(_MISSING) from ex
 
     @staticmethod
-    def reset(token: Token) -> NoReturn:
+    def reset(token: Token) -> None:
         _context.reset(token)
 
     @property
     def language(self) -> Language:
-        return _context.get().get("language", Language.English)
+        return _state().language
+
+    @staticmethod
+    def set_deadline(timeout: float) -> None:
+        """
+        The request has to be done in `timeout` seconds, the database statements are cancelled after that
+        """
+        _state().deadline = time.monotonic() + timeout
+
+    @staticmethod
+    def remaining() -> Optional[float]:
+        """
+        Seconds left before the deadline of the request, None when it has no deadline
+        """
+        deadline = _state().deadline
+        return None if deadline is None else deadline - time.monotonic()
 
 
 request_context = _Context()
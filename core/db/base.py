@@ -1,13 +1,181 @@
-from sqlalchemy import MetaData
+import time
+from typing import Any, Callable
+
+from sqlalchemy import MetaData, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from core.config import settings
+from core.context import request_context
+from core.db.exceptions import DeadlineExceeded
+from core.db.slow_queries import slow_query_log
+
+
+def _sqlite_pragmas(read_only: bool) -> Callable[[Any, Any], None]:
+    """
+    Connect listener that tunes every new SQLite connection of the pool
+    """
+
+    def _on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            # The journal mode is persisted in the database file, only the writer can change it
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={settings.DB_SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={settings.DB_SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.DB_SQLITE_BUSY_TIMEOUT}")
+        cursor.close()
+
+    return _on_connect
+
+
+def _sqlite_progress_handler(dbapi_connection: Any, connection_record: Any) -> None:
+    """
+    Interrupt the running statement of the connection once the deadline of its request is over
+    """
+    info = connection_record.info
+
+    def _handler() -> int:
+        request = info.get("request")
+        deadline = request.deadline if request else None
+        return int(deadline is not None and time.monotonic() > deadline)
+
+    connection = dbapi_connection._connection  # pylint: disable=W0212
+    dbapi_connection.await_(connection.set_progress_handler(_handler, settings.DB_SQLITE_PROGRESS_STEPS))
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool):
+    request = request_context.current()
+    if request is None or request.deadline is None:
+        return
+    remaining = request.deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("The request deadline is over")
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        # Read by the progress handler while the statement runs
+        conn.info["request"] = request
+        return
+    if dialect != "postgresql":
+        # No per-transaction timeout elsewhere (max_execution_time of MySQL is per session and only for the SELECTs),
+        # the deadline is only checked before each statement
+        return
+    # SET LOCAL lasts until the end of the transaction: it's sent with its first statement, then again only once
+    # half of the budget it set is spent, a statement can't overrun the deadline by more than that
+    timeout = conn.info.get("statement_timeout")
+    if timeout is None or timeout[0] != request.deadline or remaining * 2000 < timeout[1]:
+        milliseconds = max(int(remaining * 1000), 1)
+        cursor.execute(f"SET LOCAL statement_timeout = {milliseconds}")
+        conn.info["statement_timeout"] = (request.deadline, milliseconds)
+
+
+def _after_cursor_execute(conn: Any, *args: Any) -> None:
+    conn.info.pop("request", None)
+
+
+def _end_transaction(conn: Any) -> None:
+    # The info of the connection outlives the transaction, and its SET LOCAL
+    conn.info.pop("statement_timeout", None)
+
+
+def _handle_error(context: Any) -> None:
+    if context.connection is not None:
+        context.connection.info.pop("request", None)
+    if isinstance(context.original_exception, DeadlineExceeded):
+        return
+    request = request_context.current()
+    if request is not None and request.deadline is not None and request.deadline <= time.monotonic():
+        # The statement was interrupted (SQLite) or cancelled (statement_timeout) by the deadline
+        raise DeadlineExceeded("The request deadline is over") from context.original_exception
+
+
+def _apply_deadlines(sync_engine: Engine) -> None:
+    """
+    Cancel the statements of a request once its deadline is over
+    """
+    if settings.IS_SQLITE:
+        event.listen(sync_engine, "connect", _sqlite_progress_handler)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    if sync_engine.dialect.name == "postgresql":
+        event.listen(sync_engine, "commit", _end_transaction)
+        event.listen(sync_engine, "rollback", _end_transaction)
+
+
+class RoutingSession(Session):
+    """
+    Send the reads to the read-only pool and the writes to the single writer connection.
+    Once a transaction has written, its reads stay on the writer so they can see the uncommitted rows.
+    """
+
+    _writing = False
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Any:
+        if self._writing or self._flushing or getattr(clause, "is_dml", False):
+            self._writing = True
+            return engine.sync_engine
+        return read_engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release_writer(session: RoutingSession, transaction: Any) -> None:
+    if transaction.parent is None:
+        session._writing = False  # pylint: disable=W0212
+
 
+if settings.IS_SQLITE and settings.DB_SQLITE_WAL:
+    # A single writer connection, the pool checkout is the queue of the writes
+    engine = create_async_engine(
+        settings.DB_DSN,
+        echo=settings.DB_ECHO,
+        future=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.DB_SQLITE_BUSY_TIMEOUT / 1000,
+    )
+    read_engine = create_async_engine(
+        settings.DB_READ_DSN,
+        echo=settings.DB_ECHO,
+        future=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_pragmas(read_only=False))
+    event.listen(read_engine.sync_engine, "connect", _sqlite_pragmas(read_only=True))
+    async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=RoutingSession, future=True
+    )
+elif settings.IS_SQLITE:
+    engine = create_async_engine(settings.DB_DSN, echo=settings.DB_ECHO, future=True, connect_args={"timeout": 15})
+    read_engine = engine
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession, future=True)
+else:
+    engine = create_async_engine(
+        settings.DB_DSN,
+        echo=settings.DB_ECHO,
+        future=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    read_engine = engine
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession, future=True)
 
-engine = create_async_engine(settings.DB_DSN, echo=settings.DB_ECHO, future=True, connect_args={"timeout": 15})
+_apply_deadlines(engine.sync_engine)
+if read_engine is not engine:
+    _apply_deadlines(read_engine.sync_engine)
 
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession, future=True)
+if settings.SLOW_QUERY_LOG:
+    slow_query_log.listen(engine, read_engine)
+    if read_engine is not engine:
+        slow_query_log.listen(read_engine, read_engine)
 
 metadata = MetaData()
 
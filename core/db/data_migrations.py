@@ -0,0 +1,203 @@
+"""
+Data migrations (backfills) of the large tables: the rows are processed in batches ordered by a unique key,
+each batch is committed with its checkpoint in `data_migrations`, so memory and locks stay bounded and an
+interrupted run resumes after the last committed batch. The throughput can be throttled.
+
+In the upgrade of a revision, after its DDL:
+
+    doctors = sa.table("doctors", sa.column("id", UUID()), sa.column("price"))
+    DataMigration("doctors_price", doctors, update(doctors, {"price": 0})).run_in_migration()
+
+The key must not be changed by the processing, use another unique column (the rowid on SQLite) then.
+"""
+import datetime
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.engine import Connection, Dialect, Engine, Row
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+from core.config import settings
+from core.db.base import metadata
+from core.db.models import utcnow
+
+
+logger = logging.getLogger(__name__)
+
+# The checkpoint of each data migration
+data_migrations = sa.Table(
+    "data_migrations",
+    metadata,
+    sa.Column("name", sa.String(255), primary_key=True),
+    sa.Column("last_key", sa.String(255), nullable=True),
+    sa.Column("rows", sa.Integer(), nullable=False),
+    sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+)
+
+# Processes a batch: the connection of its transaction, its rows and the condition selecting them
+Process = Callable[[Connection, List[Row], Any], None]
+
+
+# The checkpoint keys of these types are stored in ISO 8601
+ISO_TYPES = (datetime.date, datetime.time)
+
+
+def dump_key(value: Any) -> str:
+    """
+    The key of a checkpoint as a string
+    """
+    return value.isoformat() if isinstance(value, ISO_TYPES) else str(value)
+
+
+def load_key(value: str, key_type: TypeEngine, dialect: Dialect) -> Any:
+    """
+    The key of a checkpoint, from its string. A type decorator parses the value of its underlying type
+    """
+    if isinstance(key_type, TypeDecorator):
+        return key_type.process_result_value(load_key(value, key_type.impl, dialect), dialect)
+    try:
+        python_type = key_type.python_type
+    except NotImplementedError:
+        return value
+    if issubclass(python_type, ISO_TYPES):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def update(table: sa.Table, values: Dict[str, Any]) -> Process:
+    """
+    Process the batches with a single UPDATE, the values can be SQL expressions
+    """
+
+    def _update(connection: Connection, rows: List[Row], condition: Any) -> None:
+        connection.execute(sa.update(table).where(condition).values(values))
+
+    return _update
+
+
+class DataMigration:
+    """
+    Process the rows of `table` (matching `where`) by batches of `batch_size` rows ordered by the `key` column,
+    at most `rate` rows per second. The rows of the batches have the key and the `columns`.
+    The progress is logged every `report_every` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        table: sa.Table,
+        process: Process,
+        key: str = "id",
+        columns: Optional[List[str]] = None,
+        where: Any = None,
+        batch_size: Optional[int] = None,
+        rate: Optional[float] = None,
+        report_every: float = 10,
+    ) -> None:
+        self.name = name
+        self.table = table
+        self.process = process
+        self.key = table.c[key]
+        self.columns = [table.c[column] for column in columns or []]
+        self.where = where
+        self.batch_size = settings.DATA_MIGRATION_BATCH_SIZE if batch_size is None else batch_size
+        self.rate = settings.DATA_MIGRATION_RATE if rate is None else rate
+        self.report_every = report_every
+
+    def _conditions(self, after: Any) -> List[Any]:
+        conditions = [] if self.where is None else [self.where]
+        if after is not None:
+            conditions.append(self.key > after)
+        return conditions
+
+    def run(self, engine: Engine) -> int:
+        """
+        Run, or resume, the migration. Returns the number of processed rows, of all the runs
+        """
+        name = data_migrations.c.name == self.name
+        with engine.begin() as connection:
+            checkpoint = connection.execute(sa.select(data_migrations).where(name)).mappings().first()
+            if checkpoint is None:
+                created_at = utcnow()
+                connection.execute(
+                    sa.insert(data_migrations).values(
+                        name=self.name, rows=0, started_at=created_at, updated_at=created_at
+                    )
+                )
+            elif checkpoint["finished_at"] is not None:
+                logger.info("%s: done already, %d rows", self.name, checkpoint["rows"])
+                return checkpoint["rows"]
+            last_key = None
+            if checkpoint is not None and checkpoint["last_key"] is not None:
+                last_key = load_key(checkpoint["last_key"], self.key.type, engine.dialect)
+            done = checkpoint["rows"] if checkpoint else 0
+            remaining = connection.execute(
+                sa.select(sa.func.count()).select_from(self.table).where(sa.and_(True, *self._conditions(last_key)))
+            ).scalar()
+        if checkpoint is not None:
+            logger.info("%s: resuming after %d rows", self.name, done)
+
+        total = done + remaining
+        started_at = reported_at = time.monotonic()
+        processed = 0
+        while True:
+            with engine.begin() as connection:
+                conditions = self._conditions(last_key)
+                query = (
+                    sa.select(self.key, *self.columns)
+                    .where(sa.and_(True, *conditions))
+                    .order_by(self.key)
+                    .limit(self.batch_size)
+                )
+                rows = connection.execute(query).all()
+                progress: Dict[str, Any] = {"updated_at": utcnow()}
+                if rows:
+                    self.process(connection, rows, sa.and_(True, *conditions, self.key <= rows[-1][0]))
+                    last_key = rows[-1][0]
+                    done += len(rows)
+                    progress.update(last_key=dump_key(last_key), rows=done)
+                else:
+                    progress["finished_at"] = progress["updated_at"]
+                connection.execute(sa.update(data_migrations).where(name).values(progress))
+
+            processed += len(rows)
+            now = time.monotonic()
+            if not rows or now - reported_at >= self.report_every:
+                reported_at = now
+                speed = processed / max(now - started_at, 1e-9)
+                logger.info(
+                    "%s: %d/%d rows (%.0f%%), %.0f rows/s",
+                    self.name,
+                    done,
+                    total,
+                    100 * done / total if total else 100,
+                    speed,
+                )
+            if not rows:
+                return done
+            if self.rate:
+                # Ahead of the rate, wait for it
+                time.sleep(max(processed / self.rate - (time.monotonic() - started_at), 0))
+
+    def run_in_migration(self) -> int:
+        """
+        Run from the upgrade of an Alembic revision: the transaction of the migration is committed first, the
+        batches are committed on their own connection
+        """
+        context = op.get_context()
+        if context.as_sql:
+            raise RuntimeError(f"The data migration {self.name} can't run in offline (--sql) mode")
+        with context.autocommit_block():
+            return self.run(op.get_bind().engine)
+
+    def reset(self, engine: Engine) -> None:
+        """
+        Forget the checkpoint, e.g. in the downgrade, the next run starts over
+        """
+        with engine.begin() as connection:
+            connection.execute(sa.delete(data_migrations).where(data_migrations.c.name == self.name))
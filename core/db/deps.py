@@ -1,5 +1,3 @@
-from typing import cast
-
 from core.context import request_context
 from core.db.base import AsyncSession, async_session
 
@@ -7,7 +5,7 @@ from core.db.base import AsyncSession, async_session
 async def init_db() -> AsyncSession:
     """Store db session in the context var and reset it"""
     db = async_session()
-    request_context.set("db", db)
+    request_context.state.db = db
     try:
         yield db
     finally:
@@ -17,7 +15,7 @@ async def init_db() -> AsyncSession:
 
 def get_db() -> AsyncSession:
     """Fetch db session from the context var"""
-    session = cast(AsyncSession, request_context.get("db"))
+    session: AsyncSession = request_context.state.db
     if session is None:
         raise Exception("Missing session")
     return session
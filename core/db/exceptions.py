@@ -9,3 +9,9 @@ class DatabaseValidationError(DatabaseException):
     def __init__(self, message: str, field: Optional[str] = None) -> None:
         self.message = message
         self.field = field
+
+
+class DeadlineExceeded(DatabaseException):
+    """
+    The statement was cancelled, or not even started, because the request deadline is over
+    """
@@ -1,10 +1,30 @@
+import collections
 import datetime
 import logging
 import re
 import uuid
-from typing import Any, Dict, List, NoReturn, Optional, Tuple, Type, TypedDict, TypeVar
+from functools import lru_cache
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NoReturn,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Type,
+    TypedDict,
+    TypeVar,
+    cast,
+)
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
@@ -22,6 +42,9 @@ logger = logging.getLogger(__name__)
 
 TBase = TypeVar("TBase", bound="BaseModel")
 
+# Dialects with INSERT ... ON CONFLICT
+UPSERT_DIALECTS = {"sqlite": sqlite, "postgresql": postgresql}
+
 
 class TranslationConfig:
     model: TBase
@@ -45,6 +68,58 @@ class TranslationConfig:
         return getattr(self.model, self.fk)
 
 
+def before_commit(key: str, callback: Callable[[], Awaitable[None]]) -> None:
+    """
+    Run the callback once, right before the next commit of the current session (BaseModel.commit)
+    """
+    get_db().info.setdefault("before_commit", {})[key] = callback
+
+
+def after_commit(key: str, callback: Callable[[Any], Awaitable[None]], state: Callable[[], Any] = dict) -> Any:
+    """
+    Run the callback once, right after the next successful commit of the current session (BaseModel.commit),
+    with the state of the key: a new `state()` for each commit, returned to be filled until then.
+    Both are popped before the commit, a failed commit drops them
+    """
+    callbacks = get_db().info.setdefault("after_commit", {})
+    if key not in callbacks:
+        callbacks[key] = (callback, state())
+    return callbacks[key][1]
+
+
+class Row(Protocol):
+    """
+    An immutable row of `row_type`, its fields are attributes
+    """
+
+    _fields: Tuple[str, ...]
+
+    def _replace(self, **values: Any) -> "Row":
+        ...
+
+    def __iter__(self) -> Iterator[Any]:
+        ...
+
+    def __getattr__(self, name: str) -> Any:
+        ...
+
+
+class RowType(Protocol):
+    def __call__(self, *values: Any) -> Row:
+        ...
+
+    def _make(self, values: Iterable[Any]) -> Row:
+        ...
+
+
+@lru_cache(maxsize=128)
+def row_type(name: str, fields: Tuple[str, ...]) -> RowType:
+    """
+    The immutable rows of these fields: named tuples, no instance dict and the attributes of the instances
+    """
+    return cast(RowType, collections.namedtuple(name, fields))
+
+
 def utcnow() -> datetime.datetime:
     """Generates timezone-aware UTC datetime."""
     return datetime.datetime.now(datetime.timezone.utc)
@@ -52,7 +127,8 @@ def utcnow() -> datetime.datetime:
 
 class TimestampMixin:
     created_at = sa.Column(sa.DateTime(timezone=True), default=utcnow, nullable=False)
-    updated_at = sa.Column(sa.DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False)
+    # Indexed for the change feeds
+    updated_at = sa.Column(sa.DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False, index=True)
 
 
 class BaseModel(Base):
@@ -85,16 +161,38 @@ class BaseModel(Base):
         return query
 
     @classmethod
-    async def _get_joined_query(cls: Type[TBase], language) -> sa.orm.Query:
+    async def _get_joined_query(cls: Type[TBase], language, fields: Optional[Sequence[str]] = None) -> sa.orm.Query:
+        """
+        The instances with their translation, or only the `fields` columns (and the id) when they are given
+        """
         translation: TranslationConfig = cls.__translation__
         TranslationModel: TBase = translation.model  # noqa
+        columns = [cls, *translation.get_translation_fields()]
+        if fields is not None:
+            columns = [cls.id]
+            columns.extend(getattr(cls, name) for name in fields if name != "id" and name in cls.__table__.columns)
+            columns.extend(field for field in translation.get_translation_fields() if field.key in fields)
         query = (
-            sa.select(cls, *translation.get_translation_fields())
+            sa.select(*columns)
             .join(TranslationModel, translation.get_fk_field() == cls.id)
             .where(TranslationModel.language_code == language)
         )
         return query
 
+    @classmethod
+    async def _get_filtered_query(
+        cls: Type[TBase], filters: Dict[str, Any], language: Language, fields: Optional[Sequence[str]] = None
+    ) -> sa.orm.Query:
+        query = await cls._get_joined_query(language, fields)
+        return query.where(sa.and_(True, *cls._build_filters(filters)))
+
+    @classmethod
+    def row_fields(cls) -> List[str]:
+        """
+        The columns and the translated fields
+        """
+        return [*cls.__table__.columns.keys(), *cls.__translation__.fields]
+
     @classmethod
     def _get_db(cls) -> AsyncSession:
         return get_db()
@@ -131,6 +229,46 @@ class BaseModel(Base):
         db_execute = await db.execute(query)
         return db_execute.first()
 
+    @classmethod
+    async def get_many(
+        cls: Type[TBase], ids: Sequence[uuid.UUID], language: Optional[Language] = None, chunk_size: int = 500
+    ) -> List[Optional[TBase]]:
+        """
+        The instances of the ids in the same order, None for the missing ones. One query per `chunk_size` ids
+        """
+        db = get_db()
+        unique_ids = list(dict.fromkeys(ids))
+        found: Dict[uuid.UUID, TBase] = {}
+        for start in range(0, len(unique_ids), chunk_size):
+            chunk = unique_ids[start : start + chunk_size]
+            query = await cls._get_joined_query(language) if language else sa.select(cls)
+            query = query.where(cls.id.in_(chunk)).execution_options(populate_existing=True)
+            db_execute = await db.execute(query)
+            found.update((instance.id, instance) for instance in db_execute.scalars())
+        return [found.get(id) for id in ids]
+
+    @classmethod
+    async def get_translations(
+        cls: Type[TBase], ids: Sequence[uuid.UUID], languages: Sequence[Language], chunk_size: int = 500
+    ) -> Dict[uuid.UUID, Dict[str, Dict[str, Any]]]:
+        """
+        The translated fields of the instances in each of the languages, {id: {language: {field: value}}}.
+        One query per `chunk_size` ids, the missing translations are left out
+        """
+        db = get_db()
+        translation: TranslationConfig = cls.__translation__
+        fk = translation.get_fk_field()
+        fields = translation.get_translation_fields()
+        translations: Dict[uuid.UUID, Dict[str, Dict[str, Any]]] = {id: {} for id in ids}
+        unique_ids = list(translations)
+        for start in range(0, len(unique_ids), chunk_size):
+            query = sa.select(fk, translation.model.language_code, *fields).where(
+                fk.in_(unique_ids[start : start + chunk_size]), translation.model.language_code.in_(languages)
+            )
+            for id, language_code, *values in (await db.execute(query)).all():
+                translations[id][language_code] = {field.key: value for field, value in zip(fields, values)}
+        return translations
+
     @classmethod
     async def filter(
         cls: Type[TBase],
@@ -145,6 +283,24 @@ class BaseModel(Base):
         db_execute = await db.execute(query.where(sa.and_(True, *cls._build_filters(filters))))
         return db_execute.scalars()
 
+    @classmethod
+    async def filter_rows(
+        cls: Type[TBase],
+        filters: Dict[str, Any],
+        *,
+        language: Language,
+        sorting: Optional[Dict[str, str]] = None,
+    ) -> List[Row]:
+        """
+        The filtered instances in the language as immutable named tuples (`row_type`), without the ORM:
+        only the columns are selected and nothing is tracked by the session. For the read-only lists and exports
+        """
+        query = await cls._get_filtered_query(filters, language, cls.row_fields())
+        query = cls._sort_query(query, filters, sorting)
+        db_execute = await get_db().execute(query)
+        Row = row_type(f"{cls.__name__}Row", tuple(db_execute.keys()))
+        return [Row._make(row) for row in db_execute]
+
     @classmethod
     async def join_filter(cls: Type[TBase], language=Language.English):
         db = get_db()
@@ -158,6 +314,15 @@ class BaseModel(Base):
         db_execute = await db.execute(query)
         return db_execute.scalars().all()
 
+    @classmethod
+    def _sort_query(cls, query: Any, filters: Dict[str, Any], sorting: Optional[Dict[str, str]]) -> Any:
+        """
+        Order the filtered query by `sorting`, the models can order by their filters instead
+        """
+        if sorting is not None:
+            query = query.order_by(*cls._build_sorting(sorting))
+        return query
+
     @classmethod
     def _build_sorting(cls, sorting: Dict[str, str]) -> List[Any]:
         """Build list of ORDER_BY clauses"""
@@ -181,14 +346,229 @@ class BaseModel(Base):
             result.append(operator(column, value))
         return result
 
+    @classmethod
+    async def commit(cls) -> None:
+        """
+        Run the callbacks registered by the after_save hooks, then commit, all in the same transaction.
+        The after_commit callbacks run once it's committed
+        """
+        db: AsyncSession = get_db()
+        for callback in db.info.pop("before_commit", {}).values():
+            await callback()
+        callbacks = db.info.pop("after_commit", {})
+        await db.commit()
+        for callback, state in callbacks.values():
+            await callback(state)
+
+    async def after_save(self) -> None:
+        """
+        Hook called once the instance is flushed, in the same transaction
+        """
+
+    @classmethod
+    async def after_bulk_save(cls, rows: List[Dict[str, Any]]) -> None:
+        """
+        Hook called once rows are written by a set-based statement (upsert, update_where, delete_where),
+        in the same transaction
+        """
+
+    @classmethod
+    async def after_bulk_delete(cls, rows: List[Dict[str, Any]]) -> None:
+        """
+        Hook called once rows are deleted by delete_where, in the same transaction. Runs after_bulk_save by default
+        """
+        await cls.after_bulk_save(rows)
+
+    @classmethod
+    def _constraint_columns(cls, constraint: Optional[str]) -> List[str]:
+        """
+        Columns of the unique constraint named `constraint`, of the primary key when it's None
+        """
+        if constraint is None:
+            return [column.name for column in cls.__table__.primary_key.columns]
+        for table_constraint in cls.__table__.constraints:
+            if table_constraint.name == constraint:
+                return [column.name for column in table_constraint.columns]
+        raise KeyError(f"{cls.__name__} has no constraint {constraint}")
+
+    @classmethod
+    def _upsert_statement(
+        cls, dialect: str, rows: List[Dict[str, Any]], conflict: List[str], update: Sequence[str]
+    ) -> Optional[Any]:
+        """
+        The upsert statement of the dialect, None when it has none
+        """
+        table = cls.__table__
+        if dialect in UPSERT_DIALECTS:
+            statement = UPSERT_DIALECTS[dialect].insert(table).values(rows)
+            values = {name: statement.excluded[name] for name in update}
+        elif dialect == "mysql":
+            statement = mysql.insert(table).values(rows)
+            values = {name: statement.inserted[name] for name in update}
+        else:
+            return None
+        if values and "updated_at" in table.c:
+            values["updated_at"] = utcnow()
+
+        if dialect == "mysql":
+            # Any unique key of the table conflicts, assigning a column to itself changes nothing
+            return statement.on_duplicate_key_update(values or {conflict[0]: table.c[conflict[0]]})
+        if values:
+            return statement.on_conflict_do_update(index_elements=conflict, set_=values)
+        return statement.on_conflict_do_nothing(index_elements=conflict)
+
+    @classmethod
+    async def _upsert_rows(
+        cls, db: AsyncSession, rows: List[Dict[str, Any]], conflict: List[str], update: Sequence[str]
+    ) -> None:
+        """
+        Upsert of the dialects without one: select the existing keys, update those rows, insert the others.
+        Not atomic, a concurrent insert of the same key fails on the constraint
+        """
+        table = cls.__table__
+        keys = [table.c[name] for name in conflict]
+        found = await db.execute(
+            sa.select(*keys).where(sa.or_(*(sa.and_(*(key == row[key.name] for key in keys)) for row in rows)))
+        )
+        existing = {tuple(row) for row in found}
+        updates = [row for row in rows if tuple(row[name] for name in conflict) in existing]
+        inserts = [row for row in rows if tuple(row[name] for name in conflict) not in existing]
+
+        if updates and update:
+            # The names of the columns are reserved for the parameters of the statement
+            values = {name: sa.bindparam(f"value_{name}") for name in update}
+            if "updated_at" in table.c:
+                values["updated_at"] = utcnow()
+            statement = (
+                sa.update(table)
+                .where(sa.and_(*(key == sa.bindparam(f"key_{key.name}") for key in keys)))
+                .values(values)
+            )
+            params = [
+                {**{f"value_{name}": row[name] for name in update}, **{f"key_{name}": row[name] for name in conflict}}
+                for row in updates
+            ]
+            await db.execute(statement, params)
+        if inserts:
+            await db.execute(sa.insert(table), inserts)
+
+    @classmethod
+    async def bulk_upsert(
+        cls,
+        rows: List[Dict[str, Any]],
+        constraint: Optional[str] = None,
+        update: Optional[Sequence[str]] = None,
+        commit: bool = True,
+    ) -> None:
+        """
+        Insert the rows, or update the `update` columns (all the given ones by default) of the rows that conflict
+        on the unique `constraint` (the primary key by default): INSERT ... ON CONFLICT DO UPDATE (SQLite and
+        PostgreSQL), INSERT ... ON DUPLICATE KEY UPDATE (MySQL, on any unique key), a select then an update and an
+        insert on the other dialects
+        """
+        if not rows:
+            return
+        db: AsyncSession = get_db()
+        dialect = db.bind.dialect.name
+
+        table = cls.__table__
+        conflict = cls._constraint_columns(constraint)
+        if "id" in table.c and "id" not in conflict:
+            # Known ids for the hooks, the default would only be generated by the insert
+            rows = [row if row.get("id") else {**row, "id": default_uuid()} for row in rows]
+        if update is None:
+            update = [name for name in rows[0] if name not in conflict and name not in ("id", "created_at")]
+        # Bound parameters per statement stay under the SQLite limit (999 before 3.32)
+        chunk_size = max(1, 900 // len(table.c))
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start : start + chunk_size]
+                statement = cls._upsert_statement(dialect, chunk, conflict, update)
+                if statement is None:
+                    await cls._upsert_rows(db, chunk, conflict, update)
+                else:
+                    await db.execute(statement)
+            await cls.after_bulk_save(rows)
+            if commit:
+                await cls.commit()
+        except IntegrityError as e:
+            cls._raise_validation_exception(e)
+
+    @classmethod
+    async def _write_where(
+        cls,
+        statement: Any,
+        conditions: List[Any],
+        commit: bool,
+        hook: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ) -> int:
+        """
+        Run the UPDATE/DELETE and the hook (after_bulk_save by default) with the written rows: from RETURNING
+        when the dialect has it, selected right before in the same transaction otherwise. Returns the number of
+        written rows
+        """
+        db: AsyncSession = get_db()
+        table = cls.__table__
+        try:
+            if db.bind.dialect.full_returning:
+                db_execute = await db.execute(statement.returning(*table.c))
+                rows = [dict(row) for row in db_execute.mappings()]
+                count = len(rows)
+            else:
+                # No other writer can change the selected rows before they are written: the rows are locked
+                # (SELECT ... FOR UPDATE), SQLite has no row locks, the write lock of the database is taken first
+                # with a write of no row (it also routes the select to the writer connection in WAL mode)
+                if db.bind.dialect.name == "sqlite":
+                    key = next(iter(table.primary_key.columns))
+                    await db.execute(sa.update(table).where(sa.false()).values({key.name: key}))
+                db_execute = await db.execute(sa.select(table).where(sa.and_(True, *conditions)).with_for_update())
+                rows = [dict(row) for row in db_execute.mappings()]
+                count = (await db.execute(statement)).rowcount if rows else 0
+            if rows:
+                await (hook or cls.after_bulk_save)(rows)
+            if commit:
+                await cls.commit()
+        except IntegrityError as e:
+            cls._raise_validation_exception(e)
+        return count
+
+    @classmethod
+    async def update_where(cls, filters: Dict[str, Any], values: Dict[str, Any], commit: bool = True) -> int:
+        """
+        Update the rows matching the filters in a single UPDATE ... WHERE, the values can be SQL expressions.
+        Returns the number of updated rows
+        """
+        conditions = cls._build_filters(filters)
+        values = dict(values)
+        if "updated_at" in cls.__table__.c:
+            values.setdefault("updated_at", utcnow())
+        statement = sa.update(cls.__table__).where(sa.and_(True, *conditions)).values(values)
+        return await cls._write_where(statement, conditions, commit)
+
+    @classmethod
+    async def delete_where(cls, filters: Dict[str, Any], commit: bool = True) -> int:
+        """
+        Delete the rows matching the filters in a single DELETE ... WHERE. Returns the number of deleted rows
+        """
+        conditions = cls._build_filters(filters)
+        statement = sa.delete(cls.__table__).where(sa.and_(True, *conditions))
+        return await cls._write_where(statement, conditions, commit, hook=cls.after_bulk_delete)
+
+    @classmethod
+    async def upsert(cls, values: Dict[str, Any], constraint: Optional[str] = None, commit: bool = True) -> None:
+        """
+        Insert or update one row in a single statement, see bulk_upsert
+        """
+        await cls.bulk_upsert([values], constraint=constraint, commit=commit)
+
     async def save(self, commit: bool = True) -> None:
         db: AsyncSession = get_db()
         db.add(self)
         try:
+            await db.flush()
+            await self.after_save()
             if commit:
-                await db.commit()
-            else:
-                await db.flush()
+                await self.commit()
         except IntegrityError as e:
             self._raise_validation_exception(e)
 
@@ -197,7 +577,7 @@ class BaseModel(Base):
             setattr(self, k, v)
 
     @classmethod
-    async def create(cls, obj_in: Dict[str, Any], language: Language) -> TBase:
+    async def create(cls, obj_in: Dict[str, Any], language: Language, commit: bool = True) -> TBase:
         """
         Create model with multiple language supported
         """
@@ -208,12 +588,12 @@ class BaseModel(Base):
                 obj_trans[field] = obj_in.pop(field)
 
         instance = cls(**obj_in)
-        await instance.save()
+        await instance.save(commit=False)
 
         obj_trans["language_code"] = language.value
         obj_trans[translation.fk] = instance.id
         instance_trans = translation.model(**obj_trans)
-        await instance_trans.save()
+        await instance_trans.save(commit=commit)
         return await cls.get(id=instance.id, language=language)
 
 
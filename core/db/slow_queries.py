@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import datetime
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.config import settings
+from core.context import request_context
+
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*(?:\?|\$\d+)(?:\s*,\s*(?:\?|\$\d+))*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalise(statement: str) -> str:
+    """
+    The statement without its literals and with the IN lists collapsed, the same query gets the same text
+    """
+    statement = _LITERALS.sub("?", statement)
+    statement = _PLACEHOLDER_LISTS.sub("(...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def redact(parameters: Any, executemany: bool = False) -> Any:
+    """
+    Keep the type of the parameters only, their values may be personal data
+    """
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryLog:
+    """
+    Log the statements slower than `threshold` seconds with the plan of the database, captured by a background
+    task on a connection of `explain_engine`.
+    The same query (fingerprint) is logged once per `rate_limit` seconds, the skipped ones are only counted.
+    The last `size` entries are kept for the debug endpoint.
+    """
+
+    def __init__(
+        self, threshold: Optional[float] = None, size: Optional[int] = None, rate_limit: Optional[float] = None
+    ) -> None:
+        self.threshold = settings.SLOW_QUERY_THRESHOLD if threshold is None else threshold
+        self.rate_limit = settings.SLOW_QUERY_RATE_LIMIT if rate_limit is None else rate_limit
+        self.entries: Deque[Dict[str, Any]] = collections.deque(
+            maxlen=settings.SLOW_QUERY_LOG_SIZE if size is None else size
+        )
+        self.explain_engine: Optional[AsyncEngine] = None
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def listen(self, engine: AsyncEngine, explain_engine: AsyncEngine) -> None:
+        self.explain_engine = explain_engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def remove(self, engine: AsyncEngine) -> None:
+        event.remove(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(
+        self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+    ) -> None:
+        context.slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(
+        self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+    ) -> None:
+        duration = time.perf_counter() - context.slow_query_start
+        if duration >= self.threshold and not statement.lstrip().upper().startswith("EXPLAIN"):
+            self.record(statement, parameters, duration, executemany)
+
+    def record(self, statement: str, parameters: Any, duration: float, executemany: bool = False) -> None:
+        normalised = normalise(statement)
+        fingerprint = hashlib.sha1(normalised.encode()).hexdigest()[:16]
+        last = self._last.get(fingerprint)
+        now = time.monotonic()
+        if last is not None and now - last["logged_at"] < self.rate_limit:
+            last["suppressed"] += 1
+            return
+
+        entry = {
+            "fingerprint": fingerprint,
+            "statement": normalised,
+            "parameters": redact(parameters, executemany),
+            "duration": duration,
+            "route": getattr(request_context.current(), "route", None),
+            "created_at": datetime.datetime.now(datetime.timezone.utc),
+            "plan": None,
+            "suppressed": 0,
+            "logged_at": now,
+        }
+        self._last[fingerprint] = entry
+        self.entries.append(entry)
+        logger.warning(
+            "Slow query %s %.3fs %s: %s %s", fingerprint, duration, entry["route"], normalised, entry["parameters"]
+        )
+        if self.explain_engine is not None and not executemany:
+            try:
+                task = asyncio.get_running_loop().create_task(self._explain(entry, statement, parameters))
+            except RuntimeError:
+                # Not in the event loop (migrations, scripts), no plan
+                return
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, entry: Dict[str, Any], statement: str, parameters: Any) -> None:
+        # Out of the request: its deadline doesn't apply
+        request_context.init()
+        prefix = "EXPLAIN QUERY PLAN " if settings.IS_SQLITE else "EXPLAIN "
+        try:
+            async with self.explain_engine.connect() as conn:
+                result = await conn.exec_driver_sql(prefix + statement, parameters)
+                entry["plan"] = [str(row[-1]) for row in result]
+        except Exception as e:  # pylint: disable=W0703
+            entry["plan"] = [f"EXPLAIN failed: {e}"]
+        logger.warning("Slow query %s plan: %s", entry["fingerprint"], " | ".join(entry["plan"]))
+
+    def dump(self) -> List[Dict[str, Any]]:
+        """
+        The entries, the most recent first
+        """
+        return list(reversed(self.entries))
+
+
+slow_query_log = SlowQueryLog()
@@ -1,3 +1,6 @@
+import os
+import threading
+import time
 import uuid
 
 from sqlalchemy.types import String, TypeDecorator
@@ -31,4 +34,32 @@ class UUID(TypeDecorator):
         return value
 
 
-default_uuid = uuid.uuid4
+_uuid7_lock = threading.Lock()
+_uuid7_last_timestamp = 0
+_uuid7_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Time-ordered UUID (version 7): 48 bits unix timestamp in ms, 12 bits counter, 62 random bits.
+    The counter keeps the ids monotonic within the process, even when the clock goes backwards,
+    the random bits come from os.urandom so forked workers don't share them.
+    """
+    global _uuid7_last_timestamp, _uuid7_counter  # pylint: disable=W0603
+    with _uuid7_lock:
+        timestamp = time.time_ns() // 1_000_000
+        if timestamp > _uuid7_last_timestamp:
+            _uuid7_last_timestamp = timestamp
+            _uuid7_counter = 0
+        else:
+            _uuid7_counter += 1
+            if _uuid7_counter > 0xFFF:
+                # Counter overflow, borrow the next millisecond
+                _uuid7_last_timestamp += 1
+                _uuid7_counter = 0
+        timestamp, counter = _uuid7_last_timestamp, _uuid7_counter
+    random_bits = int.from_bytes(os.urandom(8), "big") & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=(timestamp << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits)
+
+
+default_uuid = uuid7
@@ -2,9 +2,12 @@ from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from pydantic.error_wrappers import ErrorWrapper
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from starlette import status
 from starlette.requests import Request
 
-from core.db.exceptions import DatabaseValidationError
+from core.config import settings
+from core.db.exceptions import DatabaseValidationError, DeadlineExceeded
 
 
 async def database_validation_exception_handler(request: Request, exc: DatabaseValidationError) -> JSONResponse:
@@ -14,5 +17,27 @@ async def database_validation_exception_handler(request: Request, exc: DatabaseV
     )
 
 
+def overloaded_response() -> JSONResponse:
+    return JSONResponse(
+        {"detail": "The service is overloaded, please retry later"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+    )
+
+
+async def pool_timeout_exception_handler(request: Request, exc: PoolTimeoutError) -> JSONResponse:
+    """
+    No connection available in time, the database is saturated: ask the client to come back later
+    """
+    return overloaded_response()
+
+
+async def deadline_exceeded_exception_handler(request: Request, exc: DeadlineExceeded) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "The request deadline was exceeded"},
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+    )
+
+
 class ObjectDoesNotExist(Exception):
     pass
@@ -0,0 +1,178 @@
+"""
+Publish/subscribe of the server-sent events. The messages go through a broker so every worker receives them,
+then to the subscribers of the worker: LocalBroker stays in the process, enough for a single worker and the
+tests, a broker for many workers (Redis, Postgres LISTEN/NOTIFY...) implements `Broker` and is set by
+PUBSUB_BROKER.
+"""
+import abc
+import asyncio
+import collections
+import importlib
+import logging
+from typing import Callable, DefaultDict, Optional, Set
+
+from core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, str], None]
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Broker(abc.ABC):
+    """
+    Carries the messages (strings) of a channel to every worker, each worker hands them to `deliver`
+    """
+
+    @abc.abstractmethod
+    async def start(self, deliver: Deliver) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def stop(self) -> None:
+        pass
+
+
+class LocalBroker(Broker):
+    """
+    The messages stay in the process
+    """
+
+    def __init__(self) -> None:
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, channel: str, message: str) -> None:
+        if self._deliver is not None:
+            self._deliver(channel, message)
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+
+def load_broker(path: str) -> Broker:
+    """
+    The broker of a `module:Class` path
+    """
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+class Subscription:
+    """
+    The messages of a channel for one subscriber in a bounded queue: a subscriber that doesn't keep up is closed
+    instead of holding the messages for it
+    """
+
+    def __init__(self, channel: str, size: int) -> None:
+        self.channel = channel
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=size + 1)
+        self.size = size
+        self.closed = False
+        self.dropped = False
+
+    def put(self, message: str) -> bool:
+        if self.closed:
+            return False
+        if self.queue.qsize() >= self.size:
+            self.dropped = True
+            self.close(discard=True)
+            return False
+        self.queue.put_nowait(message)
+        return True
+
+    def close(self, discard: bool = False) -> None:
+        """
+        End the subscription after the pending messages, or right away when they are discarded
+        """
+        if self.closed:
+            return
+        self.closed = True
+        while discard and not self.queue.empty():
+            self.queue.get_nowait()
+        # The queue keeps a slot for the end marker
+        self.queue.put_nowait(None)
+
+    async def get(self) -> Optional[str]:
+        """
+        The next message, None once closed
+        """
+        message = await self.queue.get()
+        if message is None:
+            # For the next calls
+            self.queue.put_nowait(None)
+        return message
+
+
+class PubSub:
+    """
+    Fan out the messages of the broker to the subscriptions of this worker, at most `max_subscribers` of them
+    """
+
+    def __init__(
+        self, broker: Optional[Broker] = None, queue_size: Optional[int] = None, max_subscribers: Optional[int] = None
+    ) -> None:
+        self.broker = broker or load_broker(settings.PUBSUB_BROKER)
+        self.queue_size = settings.PUBSUB_QUEUE_SIZE if queue_size is None else queue_size
+        self.max_subscribers = settings.PUBSUB_MAX_SUBSCRIBERS if max_subscribers is None else max_subscribers
+        self.subscriptions: DefaultDict[str, Set[Subscription]] = collections.defaultdict(set)
+        self._started = False
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self.subscriptions.values())
+
+    async def start(self) -> None:
+        if not self._started:
+            self._started = True
+            await self.broker.start(self._deliver)
+
+    async def stop(self) -> None:
+        """
+        Close every subscription, the streams end so the server can shut down
+        """
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+        self.subscriptions.clear()
+        if self._started:
+            self._started = False
+            await self.broker.stop()
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self.start()
+        await self.broker.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> Subscription:
+        """
+        A subscription to the channel, to `unsubscribe` once done. Raises TooManySubscribers when full
+        """
+        await self.start()
+        if self.subscriber_count >= self.max_subscribers:
+            raise TooManySubscribers(f"More than {self.max_subscribers} subscribers")
+        subscription = Subscription(channel, self.queue_size)
+        self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions[subscription.channel].discard(subscription)
+        subscription.close()
+
+    def _deliver(self, channel: str, message: str) -> None:
+        for subscription in list(self.subscriptions.get(channel, ())):
+            if not subscription.put(message):
+                self.subscriptions[channel].discard(subscription)
+                logger.warning("Dropped a slow subscriber of %s", channel)
+
+
+pubsub = PubSub()
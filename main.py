@@ -1,15 +1,26 @@
 from typing import Any
 
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Response
 from schemas import Root
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from api.deps import check_language_code
-from api.middlewares import ContextMiddleware
+from api.middlewares import (
+    AdmissionControlMiddleware,
+    CompressionMiddleware,
+    ContextMiddleware,
+    DeadlineMiddleware,
+    ProfilingMiddleware,
+)
+from api.openapi import setup_openapi
 from api.routers import api_router
+from api.warmup import compile_statements, open_connections, readiness
 from core import exceptions
 from core.config import settings
+from core.db.base import engine, read_engine
 from core.db.deps import init_db
-from core.db.exceptions import DatabaseValidationError
+from core.db.exceptions import DatabaseValidationError, DeadlineExceeded
+from core.pubsub import pubsub
 
 
 dependencies = [Depends(check_language_code), Depends(init_db)]
@@ -17,12 +28,51 @@ dependencies = [Depends(check_language_code), Depends(init_db)]
 app = FastAPI(title=settings.PROJECT_NAME, debug=settings.DEBUG, version=settings.VERSION, dependencies=dependencies)
 app.include_router(api_router, prefix="/api")
 app.add_exception_handler(DatabaseValidationError, exceptions.database_validation_exception_handler)
+app.add_exception_handler(PoolTimeoutError, exceptions.pool_timeout_exception_handler)
+app.add_exception_handler(DeadlineExceeded, exceptions.deadline_exceeded_exception_handler)
+if settings.DEBUG or settings.DEBUG_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(DeadlineMiddleware)
 app.add_middleware(ContextMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Outermost, the rejected requests cost nothing else
+app.add_middleware(AdmissionControlMiddleware)
+build_openapi = setup_openapi(app, settings.OPENAPI_FILE)
 
 
 @app.get("/", response_model=Root, include_in_schema=False)
-def root() -> Any:
+def root(response: Response) -> Any:
     """
-    Root path, for health check or ALB check, dont need to include this in the api schema
+    Root path, for health check or ALB check, dont need to include this in the api schema.
+    A 503 until the worker is warmed up
     """
-    return {"name": settings.PROJECT_NAME}
+    if not readiness.ready:
+        response.status_code = 503
+    return {"name": settings.PROJECT_NAME, "ready": readiness.ready}
+
+
+@app.on_event("startup")
+async def warm_up() -> None:
+    """
+    Warm the worker up in the background, the health check tells when it's done
+    """
+    if not settings.WARMUP:
+        readiness.ready = True
+        return
+
+    async def open_pool_connections() -> None:
+        for pool_engine in dict.fromkeys((engine, read_engine)):
+            await open_connections(pool_engine, settings.WARMUP_CONNECTIONS)
+
+    readiness.start(
+        [open_pool_connections, compile_statements, build_openapi], settings.WARMUP_RETRY, settings.WARMUP_ATTEMPTS
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    """
+    Stop the warm-up and end the event streams, the server waits for the open responses before exiting
+    """
+    await readiness.stop()
+    await pubsub.stop()
@@ -24,6 +24,7 @@ from core.db.base import metadata
 
 # imports below are needed for autogeneration
 import models
+import core.db.data_migrations
 
 # replace aiosqlite, because alembic works with sync drivers
 config.set_main_option("sqlalchemy.url", str(settings.DB_DSN).replace("+aiosqlite", ""))
@@ -0,0 +1,24 @@
+"""Index of the doctors per category
+
+Revision ID: 3f7b9d2c5e18
+Revises: 8c4e1f7a2b90
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3f7b9d2c5e18"
+down_revision = "8c4e1f7a2b90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_doctors_categories_category_id_doctor_id", "doctors_categories", ["category_id", "doctor_id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_doctors_categories_category_id_doctor_id", table_name="doctors_categories")
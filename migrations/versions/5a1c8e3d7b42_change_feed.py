@@ -0,0 +1,71 @@
+"""Change feed: updated_at indexes, doctors_categories timestamps and tombstones
+
+Revision ID: 5a1c8e3d7b42
+Revises: 3f7b9d2c5e18
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import core
+
+# revision identifiers, used by Alembic.
+revision = "5a1c8e3d7b42"
+down_revision = "3f7b9d2c5e18"
+branch_labels = None
+depends_on = None
+
+TIMESTAMP_TABLES = (
+    "areas",
+    "areas_translation",
+    "categories",
+    "categories_translation",
+    "doctors",
+    "doctors_translation",
+    "doctors_categories",
+)
+
+
+def upgrade():
+    op.create_table(
+        "tombstones",
+        sa.Column("id", core.db.types.UUID(length=36), nullable=False),
+        sa.Column("entity", sa.String(length=64), nullable=False),
+        sa.Column("entity_id", core.db.types.UUID(length=36), nullable=False),
+        sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_tombstones_deleted_at"), "tombstones", ["deleted_at"], unique=False)
+
+    # The existing links take the timestamps of their doctor
+    op.add_column("doctors_categories", sa.Column("created_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("doctors_categories", sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True))
+    op.execute(
+        """
+        UPDATE doctors_categories SET
+            created_at = COALESCE(
+                (SELECT doctors.created_at FROM doctors WHERE doctors.id = doctors_categories.doctor_id),
+                CURRENT_TIMESTAMP
+            ),
+            updated_at = COALESCE(
+                (SELECT doctors.updated_at FROM doctors WHERE doctors.id = doctors_categories.doctor_id),
+                CURRENT_TIMESTAMP
+            )
+        """
+    )
+    with op.batch_alter_table("doctors_categories") as batch_op:
+        batch_op.alter_column("created_at", existing_type=sa.DateTime(timezone=True), nullable=False)
+        batch_op.alter_column("updated_at", existing_type=sa.DateTime(timezone=True), nullable=False)
+
+    for table in TIMESTAMP_TABLES:
+        op.create_index(op.f(f"ix_{table}_updated_at"), table, ["updated_at"], unique=False)
+
+
+def downgrade():
+    for table in TIMESTAMP_TABLES:
+        op.drop_index(op.f(f"ix_{table}_updated_at"), table_name=table)
+    with op.batch_alter_table("doctors_categories") as batch_op:
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("created_at")
+    op.drop_index(op.f("ix_tombstones_deleted_at"), table_name="tombstones")
+    op.drop_table("tombstones")
@@ -0,0 +1,32 @@
+"""Checkpoints of the data migrations
+
+Revision ID: 7d3e9a1f4c26
+Revises: 5a1c8e3d7b42
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7d3e9a1f4c26"
+down_revision = "5a1c8e3d7b42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "data_migrations",
+        sa.Column("name", sa.String(length=255), nullable=False),
+        sa.Column("last_key", sa.String(length=255), nullable=True),
+        sa.Column("rows", sa.Integer(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("data_migrations")
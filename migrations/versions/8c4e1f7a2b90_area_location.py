@@ -0,0 +1,63 @@
+"""Area location and spatial index
+
+Revision ID: 8c4e1f7a2b90
+Revises: 6b2d8e4f1a37
+Create Date: 2026-10-19 17:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "8c4e1f7a2b90"
+down_revision = "6b2d8e4f1a37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("areas", sa.Column("latitude", sa.Float(), nullable=True))
+    op.add_column("areas", sa.Column("longitude", sa.Float(), nullable=True))
+
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        # R*Tree of the area locations, kept in sync by the triggers. It is keyed by areas_rtree_keys, the rowid of
+        # areas is not stable with a UUID primary key (VACUUM or a copy of the table can renumber it)
+        op.execute("CREATE TABLE areas_rtree_keys (id INTEGER PRIMARY KEY, area_id VARCHAR(36) NOT NULL UNIQUE)")
+        op.execute("CREATE VIRTUAL TABLE areas_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+        index_area = """
+            INSERT INTO areas_rtree_keys (area_id)
+            SELECT new.id WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+            INSERT INTO areas_rtree
+            SELECT id, new.latitude, new.latitude, new.longitude, new.longitude
+            FROM areas_rtree_keys WHERE area_id = new.id;
+        """
+        unindex_area = """
+            DELETE FROM areas_rtree WHERE id = (SELECT id FROM areas_rtree_keys WHERE area_id = old.id);
+            DELETE FROM areas_rtree_keys WHERE area_id = old.id;
+        """
+        op.execute(f"CREATE TRIGGER areas_rtree_insert AFTER INSERT ON areas BEGIN {index_area} END")
+        op.execute(
+            f"CREATE TRIGGER areas_rtree_update AFTER UPDATE OF id, latitude, longitude ON areas "
+            f"BEGIN {unindex_area} {index_area} END"
+        )
+        op.execute(f"CREATE TRIGGER areas_rtree_delete AFTER DELETE ON areas BEGIN {unindex_area} END")
+    elif dialect == "postgresql":
+        op.execute("CREATE INDEX ix_areas_location ON areas USING gist (point(longitude, latitude))")
+    else:
+        op.create_index("ix_areas_location", "areas", ["latitude", "longitude"], unique=False)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TRIGGER areas_rtree_delete")
+        op.execute("DROP TRIGGER areas_rtree_update")
+        op.execute("DROP TRIGGER areas_rtree_insert")
+        op.execute("DROP TABLE areas_rtree")
+        op.execute("DROP TABLE areas_rtree_keys")
+    else:
+        op.drop_index("ix_areas_location", table_name="areas")
+    with op.batch_alter_table("areas") as batch_op:
+        batch_op.drop_column("longitude")
+        batch_op.drop_column("latitude")
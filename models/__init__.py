@@ -1,11 +1,87 @@
-from typing import Any, Dict, List, Optional
+import datetime
+import json
+import logging
+import math
+import uuid
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import sqlalchemy as sa
 from sqlalchemy.orm import column_property
 
-from core.config import Language
-from core.db.models import TimestampMixin, TranslationConfig, UUIDBaseModel
-from core.db.types import UUID
+from core.config import Language, settings
+from core.db.models import (
+    BaseModel,
+    Row,
+    TimestampMixin,
+    TranslationConfig,
+    UUIDBaseModel,
+    after_commit,
+    before_commit,
+    row_type,
+    utcnow,
+)
+from core.db.types import UUID, default_uuid
+from core.pubsub import pubsub
+
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.32
+
+# SQLite R*Tree index of the area locations and the areas of its ids, maintained by triggers on areas (see the migration)
+areas_rtree_keys = sa.table("areas_rtree_keys", sa.column("id"), sa.column("area_id"))
+areas_rtree = sa.table(
+    "areas_rtree",
+    sa.column("id"),
+    sa.column("min_lat"),
+    sa.column("max_lat"),
+    sa.column("min_lng"),
+    sa.column("max_lng"),
+)
+
+
+class Tombstone(UUIDBaseModel):
+    """
+    A deleted row (the table name and the id) for the change feeds, the row itself is gone
+    """
+
+    __tablename__ = "tombstones"
+
+    entity = sa.Column(sa.String(64), nullable=False)
+    entity_id = sa.Column(UUID(), nullable=False)
+    deleted_at = sa.Column(sa.DateTime(timezone=True), default=utcnow, nullable=False, index=True)
+
+    @classmethod
+    async def record(cls, entity: str, entity_ids: List[uuid.UUID]) -> None:
+        db = cls._get_db()
+        deleted_at = utcnow()
+        await db.execute(
+            sa.insert(cls.__table__),
+            [{"id": default_uuid(), "entity": entity, "entity_id": id, "deleted_at": deleted_at} for id in entity_ids],
+        )
+
+
+class TombstoneMixin(UUIDBaseModel):
+    """
+    Record a tombstone for each row deleted by delete_where
+    """
+
+    __abstract__ = True
+    __tablename__: str
+
+    @classmethod
+    async def after_bulk_delete(cls, rows: List[Dict[str, Any]]) -> None:
+        await super().after_bulk_delete(rows)
+        await Tombstone.record(cls.__tablename__, [row["id"] for row in rows])
+
+
+def doctors_changed(doctor_ids: List[uuid.UUID]) -> None:
+    """
+    Refresh the read model of the doctors and publish their update, with the commit
+    """
+    DoctorRead.mark_stale(doctor_ids)
+    Doctor.notify(doctor_ids)
 
 
 class AreaTranslation(TimestampMixin, UUIDBaseModel):
@@ -16,6 +92,13 @@ class AreaTranslation(TimestampMixin, UUIDBaseModel):
     language_code = sa.Column(sa.String(5), nullable=False, index=True)
     name = sa.Column(sa.String(255))
 
+    async def after_save(self) -> None:
+        await DoctorRead.mark_stale_where(Doctor.area_id == self.area_id)
+
+    @classmethod
+    async def after_bulk_save(cls, rows: List[Dict[str, Any]]) -> None:
+        await DoctorRead.mark_stale_where(Doctor.area_id.in_({row["area_id"] for row in rows}))
+
 
 class Area(TimestampMixin, UUIDBaseModel):
     """
@@ -26,8 +109,75 @@ class Area(TimestampMixin, UUIDBaseModel):
     __translation__ = TranslationConfig(fields=["name"], model=AreaTranslation)
 
     name = column_property(AreaTranslation.name)
+    latitude = sa.Column(sa.Float(), nullable=True)
+    longitude = sa.Column(sa.Float(), nullable=True)
     # distinct_id, # country_code and so on
 
+    @classmethod
+    def near(cls, latitude: float, longitude: float, radius: float) -> Tuple[Any, Any]:
+        """
+        Condition of the areas within `radius` km and their squared distance in degrees of latitude.
+        The bounding box is checked with the spatial index first (R*Tree on SQLite, GiST on PostgreSQL),
+        then the equirectangular distance, accurate enough at the scale of a city and only needs arithmetic.
+        """
+        lat_delta = radius / KM_PER_DEGREE
+        lng_scale = max(math.cos(math.radians(latitude)), 1e-6)
+        lng_delta = lat_delta / lng_scale
+        min_lat, max_lat = latitude - lat_delta, latitude + lat_delta
+        min_lng, max_lng = longitude - lng_delta, longitude + lng_delta
+
+        if settings.IS_SQLITE:
+            in_box = cls.id.in_(
+                sa.select(areas_rtree_keys.c.area_id)
+                .join(areas_rtree, areas_rtree.c.id == areas_rtree_keys.c.id)
+                .where(
+                    areas_rtree.c.max_lat >= min_lat,
+                    areas_rtree.c.min_lat <= max_lat,
+                    areas_rtree.c.max_lng >= min_lng,
+                    areas_rtree.c.min_lng <= max_lng,
+                )
+            )
+        elif settings.DB_DRIVER.startswith("postgresql"):
+            box = sa.func.box(sa.func.point(min_lng, min_lat), sa.func.point(max_lng, max_lat))
+            in_box = sa.func.point(cls.longitude, cls.latitude).op("<@")(box)
+        else:
+            in_box = sa.and_(cls.latitude.between(min_lat, max_lat), cls.longitude.between(min_lng, max_lng))
+
+        lat_diff = cls.latitude - latitude
+        lng_diff = (cls.longitude - longitude) * lng_scale
+        distance = lat_diff * lat_diff + lng_diff * lng_diff
+        return sa.and_(in_box, distance <= lat_delta * lat_delta), distance
+
+    @staticmethod
+    def with_distance(rows: List[Any]) -> List[Any]:
+        """
+        Set the distance in km on the instances of the rows selected with the `distance` of `near`
+        """
+        items = []
+        for row in rows:
+            instance = row[0]
+            instance.distance = Area.distance_km(row.distance)
+            items.append(instance)
+        return items
+
+    @staticmethod
+    def distance_km(distance_sq: float) -> float:
+        """
+        The `distance` of `near` in km
+        """
+        return round(math.sqrt(distance_sq) * KM_PER_DEGREE, 3)
+
+
+def sparse_rows(db_execute: Any) -> List[Dict[str, Any]]:
+    """
+    The rows of a sparse fieldset query as dicts, with the distance in km
+    """
+    rows = [dict(row) for row in db_execute.mappings()]
+    for row in rows:
+        if "distance" in row:
+            row["distance"] = Area.distance_km(row["distance"])
+    return rows
+
 
 class CategoryTranslation(TimestampMixin, UUIDBaseModel):
     __tablename__ = "categories_translation"
@@ -37,6 +187,14 @@ class CategoryTranslation(TimestampMixin, UUIDBaseModel):
     language_code = sa.Column(sa.String(5), nullable=False, index=True)
     name = sa.Column(sa.String(255))
 
+    async def after_save(self) -> None:
+        await DoctorRead.mark_stale_where(Doctor.categories.any(DoctorCategory.category_id == self.category_id))
+
+    @classmethod
+    async def after_bulk_save(cls, rows: List[Dict[str, Any]]) -> None:
+        category_ids = {row["category_id"] for row in rows}
+        await DoctorRead.mark_stale_where(Doctor.categories.any(DoctorCategory.category_id.in_(category_ids)))
+
 
 class Category(TimestampMixin, UUIDBaseModel):
     __tablename__ = "categories"
@@ -47,7 +205,7 @@ class Category(TimestampMixin, UUIDBaseModel):
     doctors = sa.orm.relationship("DoctorCategory", back_populates="category")
 
 
-class DoctorTranslation(TimestampMixin, UUIDBaseModel):
+class DoctorTranslation(TombstoneMixin, TimestampMixin, UUIDBaseModel):
     __tablename__ = "doctors_translation"
     __table_args__ = (sa.UniqueConstraint("doctor_id", "language_code", name="uq_doctor_id_language_code"),)
 
@@ -55,8 +213,15 @@ class DoctorTranslation(TimestampMixin, UUIDBaseModel):
     language_code = sa.Column(sa.String(5), nullable=False, index=True)
     name = sa.Column(sa.String(150))
 
+    async def after_save(self) -> None:
+        doctors_changed([self.doctor_id])
 
-class Doctor(TimestampMixin, UUIDBaseModel):
+    @classmethod
+    async def after_bulk_save(cls, rows: List[Dict[str, Any]]) -> None:
+        doctors_changed([row["doctor_id"] for row in rows])
+
+
+class Doctor(TombstoneMixin, TimestampMixin, UUIDBaseModel):
     """
     Doctor class with none-translation fields
     """
@@ -72,6 +237,36 @@ class Doctor(TimestampMixin, UUIDBaseModel):
 
     categories = sa.orm.relationship("DoctorCategory", back_populates="doctor")
 
+    # Published events, by precedence when a doctor has many in a transaction
+    EVENTS = ("deleted", "created", "updated")
+
+    @classmethod
+    def _build_filters(cls, filters: Dict[str, Any]) -> List[Any]:
+        """
+        Also the category filter, `category_id__in` with `category_match`, as a condition on the doctor
+        """
+        filters = dict(filters)
+        category_ids = filters.pop("category_id__in", [])
+        category_match = filters.pop("category_match", "any")
+        conditions = super()._build_filters(filters)
+        if category_ids:
+            conditions.append(DoctorCategory.match(cls.id, category_ids, category_match))
+        return conditions
+
+    @classmethod
+    async def _get_filtered_query(
+        cls: "Doctor", filters: Dict[str, Any], language: Language, fields: Optional[Sequence[str]] = None
+    ) -> sa.orm.Query:
+        query = await cls._get_joined_query(language, fields)
+        if filters:
+            filters = dict(filters)
+            near = filters.pop("near", None)
+            query = query.where(sa.and_(True, *cls._build_filters(filters)))
+            if near:
+                condition, _ = Area.near(*near)
+                query = query.join(Area, Area.id == cls.area_id).where(condition)
+        return query
+
     @classmethod
     async def filter(
         cls: "Doctor",
@@ -79,37 +274,513 @@ class Doctor(TimestampMixin, UUIDBaseModel):
         *,
         language: Language,
         sorting: Optional[Dict[str, str]] = None,
-    ) -> List["Doctor"]:
+        fields: Optional[Sequence[str]] = None,
+    ) -> List[Any]:
+        """
+        The doctors, or only their `fields` (and id) as dicts when they are given
+        """
         db = cls._get_db()
-        query = await cls._get_joined_query(language)
-        if filters:
-            category_ids = filters.pop("category_id__in", [])
-            query = query.where(sa.and_(True, *cls._build_filters(filters)))
-            if category_ids:
-                query = query.join(Doctor.categories).where(DoctorCategory.category_id.in_(category_ids))
-        db_execute = await db.execute(query)
+        query = await cls._get_filtered_query(filters, language, fields)
+        db_execute = await db.execute(cls._sort_query(query, filters, sorting))
+        if fields is not None:
+            return sparse_rows(db_execute)
+        if filters.get("near"):
+            return Area.with_distance(db_execute.all())
         return db_execute.scalars().all()
 
     @classmethod
-    async def create(cls, obj_in: Dict[str, Any], language: Language) -> "Doctor":
+    async def filter_rows(
+        cls,
+        filters: Dict[str, Any],
+        *,
+        language: Language,
+        sorting: Optional[Dict[str, str]] = None,
+        languages: Sequence[Language] = (),
+    ) -> List[Row]:
+        """
+        Also the category_ids, the distance in km when searching `near` and the `translations` in the `languages`
+        """
+        rows = await super().filter_rows(filters, language=language, sorting=sorting)
+        if not rows:
+            return rows
+        ids = [row.id for row in rows]
+        category_ids = await DoctorCategory.category_ids_of(ids)
+        fields = (*rows[0]._fields, "category_ids")
+        translations = None
+        if languages:
+            translations = await cls.get_translations(ids, languages)
+            fields += ("translations",)
+
+        Row = row_type(f"{cls.__name__}Row", fields)
+        items = []
+        for row in rows:
+            if "distance" in fields:
+                row = row._replace(distance=Area.distance_km(row.distance))
+            if translations is None:
+                items.append(Row(*row, category_ids[row.id]))
+            else:
+                items.append(Row(*row, category_ids[row.id], translations[row.id]))
+        return items
+
+    @classmethod
+    def _sort_query(cls, query: Any, filters: Dict[str, Any], sorting: Optional[Dict[str, str]]) -> Any:
+        """
+        Nearest first when searching `near`, with the squared `distance` (Area.near) as a column
+        """
+        if filters.get("near"):
+            _, distance = Area.near(*filters["near"])
+            return query.add_columns(distance.label("distance")).order_by(distance)
+        return super()._sort_query(query, filters, sorting)
+
+    @classmethod
+    async def facets(
+        cls: "Doctor",
+        filters: Dict[str, Any],
+        *,
+        language: Language,
+        price_buckets: List[Decimal],
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Count the doctors per area, category and price bucket, one GROUP BY query for each.
+        The filter of a facet is not applied to its own counts, so the other values of the facet stay selectable.
+        """
+        db = cls._get_db()
+
+        async def _doctor_ids(exclude: str) -> Any:
+            facet_filters = {key: value for key, value in filters.items() if key != exclude}
+            query = await cls._get_filtered_query(facet_filters, language)
+            return query.with_only_columns(cls.id).distinct().subquery()
+
+        async def _translated_counts(model: Any, fk: Any, doctor_id: Any, exclude: str) -> List[Dict[str, Any]]:
+            translation: TranslationConfig = model.__translation__
+            doctor_ids = await _doctor_ids(exclude)
+            count = sa.func.count(doctor_id)
+            query = (
+                sa.select(fk, *translation.get_translation_fields(), count)
+                .join(doctor_ids, doctor_ids.c.id == doctor_id)
+                .outerjoin(
+                    translation.model,
+                    sa.and_(translation.get_fk_field() == fk, translation.model.language_code == language),
+                )
+                .group_by(fk, *translation.get_translation_fields())
+                .order_by(count.desc())
+            )
+            db_execute = await db.execute(query)
+            return [{"id": row[0], "name": row[1], "count": row[-1]} for row in db_execute.all()]
+
+        areas = await _translated_counts(Area, cls.area_id, cls.id, exclude="area_id")
+        categories = await _translated_counts(
+            Category, DoctorCategory.category_id, DoctorCategory.doctor_id, exclude="category_id__in"
+        )
+
+        # Bucket i holds the prices from price_buckets[i] to price_buckets[i + 1], the last one is open ended
+        prices: List[Dict[str, Any]] = []
+        if price_buckets:
+            doctor_ids = await _doctor_ids(exclude="price__between")
+            bucket = sa.case(
+                *[(cls.price >= lower, index) for index, lower in reversed(list(enumerate(price_buckets)))]
+            )
+            query = (
+                sa.select(bucket, sa.func.count(cls.id))
+                .join(doctor_ids, doctor_ids.c.id == cls.id)
+                .where(cls.price >= price_buckets[0])
+                .group_by(bucket)
+            )
+            db_execute = await db.execute(query)
+            counts = dict(db_execute.all())
+            for index, lower in enumerate(price_buckets):
+                upper = price_buckets[index + 1] if index + 1 < len(price_buckets) else None
+                prices.append({"price_min": lower, "price_max": upper, "count": counts.get(index, 0)})
+        return {"areas": areas, "categories": categories, "prices": prices}
+
+    @classmethod
+    async def create(cls, obj_in: Dict[str, Any], language: Language, commit: bool = True) -> "Doctor":
         category_ids = obj_in.pop("category_ids", [])
-        instance = await super().create(obj_in=obj_in, language=language)
+        instance = await super().create(obj_in=obj_in, language=language, commit=False)
         for category_id in category_ids:
             item = DoctorCategory(doctor_id=instance.id, category_id=category_id)
-            await item.save()
+            await item.save(commit=False)
+        cls.notify([instance.id], "created")
+        if commit:
+            await cls.commit()
         return instance
 
+    async def after_save(self) -> None:
+        doctors_changed([self.id])
+
+    @classmethod
+    async def after_bulk_save(cls, rows: List[Dict[str, Any]]) -> None:
+        doctors_changed([row["id"] for row in rows])
+
+    @classmethod
+    async def delete_where(cls, filters: Dict[str, Any], commit: bool = True) -> int:
+        """
+        Delete the matching doctors with their translations and category links, each with its tombstone:
+        the consumers of the change feed drop the children too
+        """
+        doctor_ids = sa.select(cls.id).where(sa.and_(True, *cls._build_filters(filters)))
+        for model in (DoctorTranslation, DoctorCategory):
+            await model.delete_where({"doctor_id__in": doctor_ids}, commit=False)
+        return await super().delete_where(filters, commit)
+
+    @classmethod
+    async def after_bulk_delete(cls, rows: List[Dict[str, Any]]) -> None:
+        await super().after_bulk_delete(rows)
+        cls.notify([row["id"] for row in rows], "deleted")
+
+    @classmethod
+    def notify(cls, doctor_ids: Iterable[uuid.UUID], event: str = "updated") -> None:
+        """
+        Publish the event of the doctors on the `doctors` channel once the transaction is committed
+        """
+        events = after_commit("doctor_events", cls._publish)
+        for doctor_id in doctor_ids:
+            if doctor_id not in events or cls.EVENTS.index(event) < cls.EVENTS.index(events[doctor_id]):
+                events[doctor_id] = event
+
+    @classmethod
+    async def _publish(cls, events: Dict[uuid.UUID, str]) -> None:
+        for doctor_id, event in events.items():
+            try:
+                await pubsub.publish("doctors", json.dumps({"event": event, "id": str(doctor_id)}))
+            except Exception:  # pylint: disable=W0703
+                # Committed already, the change feed has it anyway
+                logger.exception("Failed to publish the %s event of the doctor %s", event, doctor_id)
+
+    @classmethod
+    async def changes(
+        cls, after: Optional[Tuple[datetime.datetime, uuid.UUID]], limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime.datetime, uuid.UUID]], bool]:
+        """
+        The doctors, translations and category links changed or deleted after the `after` (updated_at, id)
+        watermark, oldest first: the items, the watermark of the last one and whether there are more.
+        Each source is read from its updated_at index and limited before the union, the rows are then loaded
+        with one query per table.
+        updated_at is the time of the flush, not of the commit: only the changes older than CHANGES_SAFETY_LAG
+        are served, every transaction that could still commit an older updated_at is over by then
+        """
+        db = cls._get_db()
+        entities: Dict[str, Any] = {model.__tablename__: model for model in (Doctor, DoctorTranslation, DoctorCategory)}
+        until = utcnow() - datetime.timedelta(seconds=settings.CHANGES_SAFETY_LAG)
+        sources = [
+            (sa.literal(name), model.id, model.id, model.updated_at, sa.literal(False), None)
+            for name, model in entities.items()
+        ]
+        sources.append(
+            (
+                Tombstone.entity,
+                Tombstone.entity_id,
+                Tombstone.id,
+                Tombstone.deleted_at,
+                sa.literal(True),
+                Tombstone.entity.in_(list(entities)),
+            )
+        )
+        selects = []
+        for entity, id, key, updated_at, deleted, condition in sources:
+            query = sa.select(
+                entity.label("type"),
+                id.label("id"),
+                key.label("key"),
+                updated_at.label("updated_at"),
+                deleted.label("deleted"),
+            )
+            query = query.where(updated_at <= until)
+            if condition is not None:
+                query = query.where(condition)
+            if after:
+                watermark = sa.tuple_(sa.literal(after[0], updated_at.type), sa.literal(after[1], key.type))
+                query = query.where(sa.tuple_(updated_at, key) > watermark)
+            # SQLite only takes ORDER BY and LIMIT on the whole compound select, hence the subqueries
+            selects.append(sa.select(query.order_by(updated_at, key).limit(limit + 1).subquery()))
+        union = sa.union_all(*selects).subquery()
+        query = sa.select(union).order_by(union.c.updated_at, union.c.key).limit(limit + 1)
+        rows = [dict(row) for row in (await db.execute(query)).mappings()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        data: Dict[uuid.UUID, Dict[str, Any]] = {}
+        for name, model in entities.items():
+            ids = [row["id"] for row in rows if row["type"] == name and not row["deleted"]]
+            for start in range(0, len(ids), DoctorRead.refresh_chunk_size):
+                query = sa.select(model.__table__).where(
+                    model.id.in_(ids[start : start + DoctorRead.refresh_chunk_size])
+                )
+                data.update((row["id"], dict(row)) for row in (await db.execute(query)).mappings())
+
+        items = []
+        for row in rows:
+            row["deleted"] = bool(row["deleted"])
+            row["data"] = data.get(row["id"])
+            # Deleted since, its tombstone comes later in the feed
+            if row["deleted"] or row["data"] is not None:
+                items.append(row)
+        watermark = (rows[-1]["updated_at"], rows[-1]["key"]) if rows else after
+        return items, watermark, has_more
 
-class DoctorCategory(UUIDBaseModel):
+
+class DoctorCategory(TombstoneMixin, TimestampMixin, UUIDBaseModel):
     """
     M2M relationship between doctor and category
     """
 
     __tablename__ = "doctors_categories"
-    __table_args__ = (sa.UniqueConstraint("doctor_id", "category_id", name="uq_doctor_id_category_id"),)
+    __table_args__ = (
+        sa.UniqueConstraint("doctor_id", "category_id", name="uq_doctor_id_category_id"),
+        # The doctors of a category, covers the category filters
+        sa.Index("ix_doctors_categories_category_id_doctor_id", "category_id", "doctor_id"),
+    )
 
     doctor_id = sa.Column(UUID(), sa.ForeignKey("doctors.id"), nullable=False)
     category_id = sa.Column(UUID(), sa.ForeignKey("categories.id"), nullable=False)
 
     doctor = sa.orm.relationship("Doctor", back_populates="categories")
     category = sa.orm.relationship("Category", back_populates="doctors")
+
+    async def after_save(self) -> None:
+        doctors_changed([self.doctor_id])
+
+    @classmethod
+    async def after_bulk_save(cls, rows: List[Dict[str, Any]]) -> None:
+        doctors_changed([row["doctor_id"] for row in rows])
+
+    @classmethod
+    async def category_ids_of(cls, doctor_ids: List[uuid.UUID]) -> Dict[uuid.UUID, List[uuid.UUID]]:
+        """
+        The category ids of many doctors in one query
+        """
+        db = cls._get_db()
+        category_ids: Dict[uuid.UUID, List[uuid.UUID]] = {doctor_id: [] for doctor_id in doctor_ids}
+        for start in range(0, len(doctor_ids), DoctorRead.refresh_chunk_size):
+            chunk = doctor_ids[start : start + DoctorRead.refresh_chunk_size]
+            query = sa.select(cls.doctor_id, cls.category_id).where(cls.doctor_id.in_(chunk))
+            for doctor_id, category_id in (await db.execute(query)).all():
+                category_ids[doctor_id].append(category_id)
+        return category_ids
+
+    @classmethod
+    def match(cls, doctor_id: Any, category_ids: List[uuid.UUID], category_match: str = "any") -> Any:
+        """
+        Condition on `doctor_id`: the doctors in any, or all, of the categories. A filter, not a join, so no duplicates
+        """
+        category_ids = list(set(category_ids))
+        if category_match == "all":
+            doctor_ids = (
+                sa.select(cls.doctor_id)
+                .where(cls.category_id.in_(category_ids))
+                .group_by(cls.doctor_id)
+                .having(sa.func.count(sa.distinct(cls.category_id)) == len(category_ids))
+            )
+            return doctor_id.in_(doctor_ids)
+        return sa.exists().where(cls.doctor_id == doctor_id, cls.category_id.in_(category_ids))
+
+
+class DoctorRead(BaseModel):
+    """
+    Denormalised doctor, one row per translation, for the read path: no joins and no category lookup.
+    The rows are refreshed before the commit of any save that changes them, `scripts/rebuild_doctors_read.py`
+    rebuilds the whole table.
+    """
+
+    __tablename__ = "doctors_read"
+    __table_args__ = (
+        sa.Index("ix_doctors_read_language_code_area_id", "language_code", "area_id"),
+        sa.Index("ix_doctors_read_language_code_price", "language_code", "price"),
+    )
+
+    doctor_id = sa.Column(UUID(), sa.ForeignKey("doctors.id"), primary_key=True)
+    language_code = sa.Column(sa.String(5), primary_key=True)
+    name = sa.Column(sa.String(150))
+    area_id = sa.Column(UUID(), nullable=False)
+    area_name = sa.Column(sa.String(255))
+    category_ids = sa.Column(sa.JSON(), nullable=False, default=list)
+    category_names = sa.Column(sa.JSON(), nullable=False, default=list)
+    price = sa.Column(sa.DECIMAL(precision=13, scale=2), nullable=True)
+    phone_number = sa.Column(sa.String(13), nullable=True)
+    working_hours = sa.Column(sa.JSON())
+    created_at = sa.Column(sa.DateTime(timezone=True), nullable=False)
+    updated_at = sa.Column(sa.DateTime(timezone=True), nullable=False)
+
+    # Max doctor ids per IN clause
+    refresh_chunk_size = 500
+
+    @property
+    def id(self) -> uuid.UUID:
+        return self.doctor_id
+
+    @classmethod
+    def mark_stale(cls, doctor_ids: Iterable[uuid.UUID]) -> None:
+        db = cls._get_db()
+        db.info.setdefault("doctors_read_stale", set()).update(doctor_ids)
+        before_commit("doctors_read", cls.refresh_stale)
+
+    @classmethod
+    async def mark_stale_where(cls, condition: Any) -> None:
+        db = cls._get_db()
+        db_execute = await db.execute(sa.select(Doctor.id).where(condition))
+        cls.mark_stale(db_execute.scalars().all())
+
+    @classmethod
+    async def refresh_stale(cls) -> None:
+        db = cls._get_db()
+        await cls.refresh(db.info.pop("doctors_read_stale", set()))
+
+    @classmethod
+    async def refresh(cls, doctor_ids: Iterable[uuid.UUID]) -> None:
+        """
+        Rebuild the rows of the doctors from the normalised tables
+        """
+        db = cls._get_db()
+        doctor_ids = list(doctor_ids)
+        for offset in range(0, len(doctor_ids), cls.refresh_chunk_size):
+            chunk = doctor_ids[offset : offset + cls.refresh_chunk_size]
+            query = (
+                sa.select(
+                    Doctor.id,
+                    DoctorTranslation.language_code,
+                    DoctorTranslation.name,
+                    Doctor.area_id,
+                    AreaTranslation.name,
+                    Doctor.price,
+                    Doctor.phone_number,
+                    Doctor.working_hours,
+                    Doctor.created_at,
+                    Doctor.updated_at,
+                )
+                .select_from(Doctor)
+                .join(DoctorTranslation, DoctorTranslation.doctor_id == Doctor.id)
+                .outerjoin(
+                    AreaTranslation,
+                    sa.and_(
+                        AreaTranslation.area_id == Doctor.area_id,
+                        AreaTranslation.language_code == DoctorTranslation.language_code,
+                    ),
+                )
+                .where(Doctor.id.in_(chunk))
+            )
+            doctors = (await db.execute(query)).all()
+
+            query = (
+                sa.select(
+                    DoctorCategory.doctor_id,
+                    DoctorCategory.category_id,
+                    CategoryTranslation.language_code,
+                    CategoryTranslation.name,
+                )
+                .outerjoin(CategoryTranslation, CategoryTranslation.category_id == DoctorCategory.category_id)
+                .where(DoctorCategory.doctor_id.in_(chunk))
+                .order_by(DoctorCategory.doctor_id, DoctorCategory.category_id)
+            )
+            category_ids: Dict[uuid.UUID, List[uuid.UUID]] = {}
+            category_names: Dict[Any, Dict[uuid.UUID, str]] = {}
+            for doctor_id, category_id, language_code, name in (await db.execute(query)).all():
+                ids = category_ids.setdefault(doctor_id, [])
+                if category_id not in ids:
+                    ids.append(category_id)
+                if language_code:
+                    category_names.setdefault((doctor_id, language_code), {})[category_id] = name
+
+            rows = []
+            for doctor_id, language_code, name, area_id, area_name, *fields in doctors:
+                ids = category_ids.get(doctor_id, [])
+                names = category_names.get((doctor_id, language_code), {})
+                price, phone_number, working_hours, created_at, updated_at = fields
+                rows.append(
+                    {
+                        "doctor_id": doctor_id,
+                        "language_code": language_code,
+                        "name": name,
+                        "area_id": area_id,
+                        "area_name": area_name,
+                        "category_ids": [str(category_id) for category_id in ids],
+                        "category_names": [names.get(category_id) for category_id in ids],
+                        "price": price,
+                        "phone_number": phone_number,
+                        "working_hours": working_hours,
+                        "created_at": created_at,
+                        "updated_at": updated_at,
+                    }
+                )
+            await db.execute(sa.delete(cls).where(cls.doctor_id.in_(chunk)))
+            if rows:
+                await db.execute(sa.insert(cls.__table__), rows)
+
+    @classmethod
+    async def rebuild(cls, batch_size: int = 5000) -> int:
+        """
+        Refresh every doctor, in batches of ids each committed on its own
+        """
+        db = cls._get_db()
+        last_id, total = None, 0
+        while True:
+            query = sa.select(Doctor.id).order_by(Doctor.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(Doctor.id > last_id)
+            doctor_ids = (await db.execute(query)).scalars().all()
+            if not doctor_ids:
+                return total
+            await cls.refresh(doctor_ids)
+            await db.commit()
+            last_id, total = doctor_ids[-1], total + len(doctor_ids)
+
+    @classmethod
+    async def get(cls, id: uuid.UUID, language: Optional[Language] = None) -> Optional["DoctorRead"]:
+        db = cls._get_db()
+        query = (
+            sa.select(cls)
+            .where(cls.doctor_id == id, cls.language_code == (language or Language.English))
+            .execution_options(populate_existing=True)
+        )
+        db_execute = await db.execute(query)
+        return db_execute.scalars().first()
+
+    @classmethod
+    async def get_many(
+        cls, ids: Sequence[uuid.UUID], language: Optional[Language] = None, chunk_size: int = 500
+    ) -> List[Optional["DoctorRead"]]:
+        db = cls._get_db()
+        unique_ids = list(dict.fromkeys(ids))
+        found: Dict[uuid.UUID, DoctorRead] = {}
+        for start in range(0, len(unique_ids), chunk_size):
+            query = (
+                sa.select(cls)
+                .where(
+                    cls.doctor_id.in_(unique_ids[start : start + chunk_size]),
+                    cls.language_code == (language or Language.English),
+                )
+                .execution_options(populate_existing=True)
+            )
+            db_execute = await db.execute(query)
+            found.update((instance.doctor_id, instance) for instance in db_execute.scalars())
+        return [found.get(id) for id in ids]
+
+    @classmethod
+    async def filter(
+        cls, filters: Dict[str, Any], *, language: Language, fields: Optional[Sequence[str]] = None
+    ) -> List[Any]:
+        """
+        The doctors, or only their `fields` (and id) as dicts when they are given
+        """
+        db = cls._get_db()
+        filters = dict(filters)
+        category_ids = filters.pop("category_id__in", [])
+        category_match = filters.pop("category_match", "any")
+        near = filters.pop("near", None)
+        if fields is None:
+            query = sa.select(cls).execution_options(populate_existing=True)
+        else:
+            columns = [getattr(cls, name) for name in fields if name != "id" and name in cls.__table__.columns]
+            query = sa.select(cls.doctor_id.label("id"), *columns)
+        query = query.where(cls.language_code == language, *cls._build_filters(filters))
+        if category_ids:
+            query = query.where(DoctorCategory.match(cls.doctor_id, category_ids, category_match))
+        if near:
+            condition, distance = Area.near(*near)
+            query = query.join(Area, Area.id == cls.area_id).where(condition)
+            query = query.add_columns(distance.label("distance")).order_by(distance)
+        db_execute = await db.execute(query)
+        if fields is not None:
+            return sparse_rows(db_execute)
+        if near:
+            return Area.with_distance(db_execute.all())
+        return db_execute.scalars().all()
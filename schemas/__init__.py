@@ -3,19 +3,26 @@ Data IO between client and service
 """
 import uuid
 from datetime import datetime
-from typing import List, Optional
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Type
 
-from faker import Faker
-from pydantic import BaseModel, Field, StrictBool, condecimal
+from pydantic import BaseModel, Field, StrictBool, condecimal, create_model, root_validator
 
-UUID_EXAMPLE = uuid.uuid4()
-fake: Faker = Faker(["zh_CN"])
-fake.seed_locale("zh_CN", 0)
-Faker.seed(0)
+from core.config import Language
+
+# Static examples for the api document, generating them (Faker) would slow down the start of every worker
+UUID_EXAMPLE = uuid.UUID("3fa85f64-5717-4562-b3fc-2c963f66afa6")
+PHONE_NUMBER_EXAMPLE = "18066048764"
+NAME_EXAMPLE = "黄红霞"
+
+# The highest price of a doctor
+PRICE_MAX = Decimal(100000)
 
 
 class Root(BaseModel):
     name: str = Field(title="The project name", example="home-assessment")
+    ready: bool = Field(True, title="The worker is warmed up", example=True)
 
 
 class TimeWorking(BaseModel):
@@ -40,9 +47,9 @@ class DoctorBase(BaseModel):
     category_ids: List[uuid.UUID] = Field(
         [], description="Related categories that the doctor belongs to", example=[UUID_EXAMPLE]
     )
-    price: condecimal(ge=0, le=100000) = Field(..., description="The price", example=100)
-    phone_number: str = Field(None, description="The default phone number", example=fake.phone_number())
-    name: str = Field(..., description="Doctor's name", max_length=150, example=fake.name())
+    price: condecimal(ge=0, le=PRICE_MAX) = Field(..., description="The price", example=100)
+    phone_number: str = Field(None, description="The default phone number", example=PHONE_NUMBER_EXAMPLE)
+    name: str = Field(..., description="Doctor's name", max_length=150, example=NAME_EXAMPLE)
     working_hours: WorkingHours = Field(description="Working hours")
 
 
@@ -50,11 +57,28 @@ class Doctor(DoctorBase):
     id: uuid.UUID = Field(..., description="Primary key", example=UUID_EXAMPLE)
     created_at: datetime = Field(..., title="Created at datetime", example="2021-12-27T14:01:01.000000+00:00")
     updated_at: datetime = Field(..., title="Updated at datetime", example="2021-12-27T14:01:01.000000+00:00")
+    distance: Optional[float] = Field(None, description="Distance in km, when searching `near`", example=1.25)
+    translations: Optional[Dict[Language, Dict[str, Optional[str]]]] = Field(
+        None,
+        description="The translated fields in each of the `languages`",
+        example={"en_GB": {"name": "Huang Hongxia"}, "zh_CN": {"name": NAME_EXAMPLE}},
+    )
 
     class Config:
         orm_mode = True
 
 
+@lru_cache(maxsize=256)
+def sparse_model(model: Type[BaseModel], fields: FrozenSet[str]) -> Type[BaseModel]:
+    """
+    The model with only the `fields`, for the sparse fieldsets (`fields=`)
+    """
+    return create_model(
+        f"{model.__name__}Sparse",
+        **{name: (field.outer_type_, field.field_info) for name, field in model.__fields__.items() if name in fields},
+    )
+
+
 class DoctorCreate(DoctorBase):
     working_hours: Optional[WorkingHours] = Field(None, description="Working hours")
 
@@ -63,8 +87,63 @@ class Doctors(BaseModel):
     items: List[Doctor]
 
 
+class DoctorBatchGet(BaseModel):
+    ids: List[uuid.UUID] = Field(
+        ..., description="The doctor ids, at most 100", min_items=1, max_items=100, example=[UUID_EXAMPLE]
+    )
+
+
+class DoctorsBatch(Doctors):
+    missing: List[uuid.UUID] = Field([], description="The ids that are not found", example=[UUID_EXAMPLE])
+
+
+class DoctorTranslationUpdate(BaseModel):
+    name: str = Field(..., description="Doctor's name", max_length=150, example=NAME_EXAMPLE)
+
+
+class DoctorTranslation(DoctorTranslationUpdate):
+    doctor_id: uuid.UUID = Field(..., description="Doctor id", example=UUID_EXAMPLE)
+    language_code: Language = Field(..., description="Language of the translation", example=Language.Chinese)
+
+
+class DoctorChange(BaseModel):
+    type: str = Field(
+        ..., description="The table of the row: doctors, doctors_translation or doctors_categories", example="doctors"
+    )
+    id: uuid.UUID = Field(..., description="Primary key of the row", example=UUID_EXAMPLE)
+    updated_at: datetime = Field(..., description="Changed, or deleted, at", example="2021-12-27T14:01:01.000000+00:00")
+    deleted: bool = Field(..., description="The row is deleted", example=False)
+    data: Optional[Dict[str, Any]] = Field(None, description="The columns of the row, null when it's deleted")
+
+
+class DoctorChanges(BaseModel):
+    items: List[DoctorChange]
+    cursor: Optional[str] = Field(None, description="The `since` of the next call", example="WyIyMDIxLTEyLTI3Il0=")
+    has_more: bool = Field(..., description="More changes are available right away", example=False)
+
+
+class FacetCount(BaseModel):
+    id: uuid.UUID = Field(..., description="The area or category id", example=UUID_EXAMPLE)
+    name: Optional[str] = Field(None, description="Translated name", example="Mariana Medical Central")
+    count: int = Field(..., description="Number of doctors", example=10)
+
+
+class PriceBucketCount(BaseModel):
+    price_min: Decimal = Field(..., description="The min of the bucket, included", example=500)
+    price_max: Optional[Decimal] = Field(None, description="The max of the bucket, excluded", example=1000)
+    count: int = Field(..., description="Number of doctors", example=10)
+
+
+class DoctorFacets(BaseModel):
+    areas: List[FacetCount]
+    categories: List[FacetCount]
+    prices: List[PriceBucketCount]
+
+
 class AreaBase(BaseModel):
     name: str = Field(..., description="Area name", example="Mariana Medical Central", max_length=255)
+    latitude: Optional[float] = Field(None, description="Latitude of the area", ge=-90, le=90, example=22.2783)
+    longitude: Optional[float] = Field(None, description="Longitude of the area", ge=-180, le=180, example=114.1747)
 
 
 class Area(AreaBase):
@@ -87,3 +166,58 @@ class Category(AreaBase):
 
     class Config:
         orm_mode = True
+
+
+class SlowQuery(BaseModel):
+    fingerprint: str = Field(..., description="Hash of the normalised statement", example="a3f1c2d4e5b6a7c8")
+    statement: str = Field(..., description="Normalised statement", example="SELECT doctors.id FROM doctors")
+    parameters: Any = Field(None, description="Types of the parameters, their values are redacted", example=["str"])
+    duration: float = Field(..., description="Duration in seconds", example=0.75)
+    route: Optional[str] = Field(None, description="The request that ran it", example="GET /api/doctors/")
+    created_at: datetime = Field(..., title="Logged at datetime", example="2021-12-27T14:01:01.000000+00:00")
+    plan: Optional[List[str]] = Field(
+        None, description="The query plan, null until it's captured", example=["SCAN doctors"]
+    )
+    suppressed: int = Field(0, description="Occurrences skipped by the rate limit since it was logged", example=0)
+
+
+class SlowQueries(BaseModel):
+    items: List[SlowQuery]
+
+
+class ProfileFunction(BaseModel):
+    function: str = Field(..., description="file:line(function)", example="api/endpoints/doctors.py:120(list_doctors)")
+    calls: int = Field(..., description="Number of calls", example=1)
+    total_time: float = Field(..., description="Seconds in the function itself", example=0.001)
+    cumulative_time: float = Field(..., description="Seconds in the function and its callees", example=0.05)
+
+
+class Profile(BaseModel):
+    id: str = Field(..., description="Profile id", example="9f2c6e0d4b8a4c1e8f3a2b1c0d9e8f7a")
+    route: str = Field(..., description="The profiled request", example="GET /api/doctors/")
+    duration: float = Field(..., description="Duration of the request in seconds", example=0.08)
+    db_time: float = Field(..., description="Seconds spent running the statements", example=0.02)
+    db_statements: int = Field(..., description="Number of statements", example=3)
+    serialisation_time: float = Field(..., description="Seconds spent serialising the response", example=0.01)
+    functions: List[ProfileFunction] = Field(..., description="The top functions by cumulative time")
+
+
+class DoctorReprice(BaseModel):
+    area_id: Optional[uuid.UUID] = Field(None, description="Only the doctors of the area", example=UUID_EXAMPLE)
+    category_ids: List[uuid.UUID] = Field([], description="Only the doctors of any of the categories", example=[])
+    price_min: Optional[condecimal(ge=0, le=PRICE_MAX)] = Field(None, description="Only from this price", example=0)
+    price_max: Optional[condecimal(ge=0, le=PRICE_MAX)] = Field(None, description="Only up to this price", example=5000)
+    price: Optional[condecimal(ge=0, le=PRICE_MAX)] = Field(None, description="The new price", example=150)
+    percent: Optional[condecimal(ge=-100, le=1000, decimal_places=2)] = Field(
+        None, description="Or the change of the price in percent, the new prices are capped", example=10
+    )
+
+    @root_validator(skip_on_failure=True)
+    def check_price_or_percent(cls, values):
+        if (values.get("price") is None) == (values.get("percent") is None):
+            raise ValueError("Either price or percent is required")
+        return values
+
+
+class BulkUpdateResult(BaseModel):
+    count: int = Field(..., description="Number of updated rows", example=42)
@@ -1,11 +1,18 @@
 # pylint: disable=E402
+import argparse
 import asyncio
+import json
+import os
 import random
 import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
+import sqlalchemy as sa
 from faker import Faker
 
 
@@ -13,11 +20,24 @@ file = Path(__file__).resolve()
 parent, root = file.parent, file.parents[1]
 sys.path.append(str(root))
 
-from models import Area, AreaTranslation, Category, CategoryTranslation, Doctor, DoctorTranslation
+from models import (
+    Area,
+    AreaTranslation,
+    Category,
+    CategoryTranslation,
+    Doctor,
+    DoctorCategory,
+    DoctorRead,
+    DoctorTranslation,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.config import Language
 from core.context import request_context
 from core.db.base import async_session
+from core.db.deps import get_db
+from core.db.models import utcnow
+from core.db.types import default_uuid
 
 
 # Cache the initial areas and categories id so we can use when seed the doctor data
@@ -32,10 +52,14 @@ related_data = {
         {
             Language.English: "Mariana Medical Central, Room 2005",
             Language.Chinese: "马里亚纳医疗中心，2005 室",
+            "latitude": 22.2783,
+            "longitude": 114.1747,
         },
         {
             Language.English: "TH Medical Centre, Shop 2, GF, Treasure Garden",
             Language.Chinese: "TH 医疗中心, 2 号店, 宝园",
+            "latitude": 22.3372,
+            "longitude": 114.1745,
         },
     ],
     "categories": [
@@ -95,11 +119,13 @@ async def seed_related_data(items, model, model_translation):  # type: ignore
         obj_in = dict(
             name=item[Language.English],
         )
+        # Extra none-translation fields, e.g. the location of the areas
+        obj_in.update({key: value for key, value in item.items() if not isinstance(key, Language)})
         instance = await model.create(obj_in=obj_in, language=Language.English)
         fk = model.__translation__.fk
-        obj_in = dict(language_code=Language.Chinese, name=item[Language.Chinese])
+        obj_in = dict(language_code=Language.Chinese.value, name=item[Language.Chinese])
         obj_in[fk] = instance.id
-        await model_translation(**obj_in).save()
+        await model_translation.upsert(obj_in, constraint=f"uq_{fk}_language_code")
         print(model.__name__, instance.id, "created")
 
 
@@ -136,25 +162,174 @@ async def seed_doctor_data() -> None:
         print("Doctor", instance.id, "created")
 
 
-async def seed_data() -> None:
+def generate_doctor_batch(
+    size: int, area_ids: List[uuid.UUID], category_ids: List[uuid.UUID]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Build the rows of one batch of doctors, run inside a worker process.
+    Forked workers inherit the same random state, so each batch reseeds from the OS entropy.
+    """
+    rand = random.Random()
+    batch_fakers = [Faker(Language.English.value), Faker(Language.Chinese.value)]
+    for faker in batch_fakers:
+        faker.seed_instance(rand.getrandbits(64))
+
+    now = utcnow()
+    rows: Dict[str, List[Dict[str, Any]]] = {"doctors": [], "translations": [], "categories": []}
+    for _ in range(size):
+        doctor_id = default_uuid()
+        rows["doctors"].append(
+            {
+                "id": doctor_id,
+                "area_id": rand.choice(area_ids),
+                "price": round(rand.uniform(1.5, 2.5) * 1000, 2),
+                "phone_number": f'{doctor_basic["phone_number"]}{rand.randint(100, 999)}',
+                "working_hours": doctor_basic["working_hours"],
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        language_index = rand.choice([0, 1])
+        # 1/3 of record will available in other language
+        language_indexes = [language_index, 1 - language_index] if rand.choice([0, 1, 2]) == 0 else [language_index]
+        for index in language_indexes:
+            rows["translations"].append(
+                {
+                    "id": default_uuid(),
+                    "doctor_id": doctor_id,
+                    "language_code": languages[index].value,
+                    "name": batch_fakers[index].name(),
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+        if category_ids:
+            rows["categories"].append(
+                {
+                    "id": default_uuid(),
+                    "doctor_id": doctor_id,
+                    "category_id": rand.choice(category_ids),
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+    return rows
+
+
+async def _copy_rows(db: AsyncSession, table: sa.Table, rows: List[Dict[str, Any]]) -> None:
+    """
+    PostgreSQL (asyncpg) bulk path: COPY the rows instead of the INSERT statements.
+    COPY skips the column types, so the values are converted with the dialect bind processors here.
+    """
+    connection = await db.connection()
+    dialect = connection.dialect
+    columns = [column for column in table.columns if column.name in rows[0]]
+    processors = [column.type._cached_bind_processor(dialect) for column in columns]  # pylint: disable=W0212
+    records = []
+    for row in rows:
+        record = []
+        for column, processor in zip(columns, processors):
+            value = row[column.name]
+            if isinstance(column.type, sa.JSON):
+                value = json.dumps(value)
+            elif processor is not None:
+                value = processor(value)
+            record.append(value)
+        records.append(tuple(record))
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table.name, records=records, columns=[column.name for column in columns]
+    )
+
+
+async def bulk_insert(table: sa.Table, rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert the rows with a single executemany, or COPY where the driver supports it.
+    """
+    if not rows:
+        return
+    db: AsyncSession = get_db()
+    connection = await db.connection()
+    if connection.dialect.driver == "asyncpg":
+        await _copy_rows(db, table, rows)
+    else:
+        await db.execute(sa.insert(table), rows)
+
+
+async def seed_bulk_doctor_data(count: int, batch_size: int, workers: Optional[int] = None) -> None:
+    """
+    Top up the doctors table to `count` rows, batches are generated in a process pool and
+    committed one by one so a failed run can simply be restarted.
+    """
+    db: AsyncSession = get_db()
+    existing = (await db.execute(sa.select(sa.func.count()).select_from(Doctor.__table__))).scalar()
+    remaining = count - existing
+    if remaining <= 0:
+        print("Doctor", existing, "existing, skipped")
+        return
+    if not cached_data["area"]:
+        raise RuntimeError("Areas must be seeded before the doctors")
+
+    print(f"Seeding {remaining} doctors, batch size {batch_size}...")
+    sizes = [min(batch_size, remaining - offset) for offset in range(0, remaining, batch_size)]
+    loop = asyncio.get_running_loop()
+    started_at = time.monotonic()
+    created = 0
+
+    async def _insert_batch(future: asyncio.Future) -> None:
+        nonlocal created
+        rows = await future
+        await bulk_insert(Doctor.__table__, rows["doctors"])
+        await bulk_insert(DoctorTranslation.__table__, rows["translations"])
+        await bulk_insert(DoctorCategory.__table__, rows["categories"])
+        await DoctorRead.refresh(row["id"] for row in rows["doctors"])
+        await db.commit()
+        created += len(rows["doctors"])
+        print(f"Doctor {created}/{remaining} created ({created / (time.monotonic() - started_at):.0f} rows/s)")
+
+    # The default of ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep the generation window bounded so memory doesn't grow with `count`
+        window = workers * 2
+        pending: List[asyncio.Future] = []
+        for size in sizes:
+            args = (size, cached_data["area"], cached_data["category"])
+            pending.append(loop.run_in_executor(executor, generate_doctor_batch, *args))
+            if len(pending) >= window:
+                await _insert_batch(pending.pop(0))
+        while pending:
+            await _insert_batch(pending.pop(0))
+
+
+async def seed_data(count: Optional[int] = None, batch_size: int = 5000, workers: Optional[int] = None) -> None:
     print("Initialing categories and areas data...")
     await seed_related_data(related_data["areas"], Area, AreaTranslation)
     await seed_related_data(related_data["categories"], Category, CategoryTranslation)
     await seed_cache_data()
-    await seed_doctor_data()
+    if count is None:
+        await seed_doctor_data()
+    else:
+        await seed_bulk_doctor_data(count, batch_size, workers)
 
 
-async def main() -> None:
+async def main(count: Optional[int] = None, batch_size: int = 5000, workers: Optional[int] = None) -> None:
     try:
         token = request_context.init()
         db = async_session()
         request_context.set("db", db)
-        await seed_data()
+        await seed_data(count, batch_size, workers)
     finally:
         await db.close()
         request_context.reset(token)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the initial areas, categories and doctors")
+    parser.add_argument("--count", type=int, default=None, help="Total doctors to reach with the bulk mode")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Doctors per insert batch and commit")
+    parser.add_argument("--workers", type=int, default=None, help="Processes generating the fake data")
+    args = parser.parse_args()
+
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    loop.run_until_complete(main(args.count, args.batch_size, args.workers))
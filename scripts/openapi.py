@@ -0,0 +1,30 @@
+# pylint: disable=E402
+"""
+Build the OpenAPI schema artifact served by the app (settings.OPENAPI_FILE)
+
+    python scripts/openapi.py openapi.json
+"""
+import sys
+from pathlib import Path
+
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from main import app
+
+from api.openapi import encode_openapi
+from core.config import settings
+
+
+def build(output: str) -> None:
+    # Don't reuse a previous artifact that has been loaded by the app
+    app.openapi_schema = None
+    content = encode_openapi(app.openapi())
+    Path(output).write_bytes(content)
+    print("OpenAPI schema", output, len(content), "bytes")
+
+
+if __name__ == "__main__":
+    build(sys.argv[1] if len(sys.argv) > 1 else settings.OPENAPI_FILE or "openapi.json")
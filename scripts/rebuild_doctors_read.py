@@ -0,0 +1,36 @@
+# pylint: disable=E402
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from models import DoctorRead
+
+from core.context import request_context
+from core.db.base import async_session
+
+
+async def main(batch_size: int) -> None:
+    try:
+        token = request_context.init()
+        db = async_session()
+        request_context.set("db", db)
+        total = await DoctorRead.rebuild(batch_size)
+        print("DoctorRead", total, "doctors rebuilt")
+    finally:
+        await db.close()
+        request_context.reset(token)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the denormalised doctors read model")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Doctors per batch and commit")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(args.batch_size))
@@ -0,0 +1,103 @@
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict
+
+import models
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from core.config import Language, settings
+from core.db.base import engine
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def admin_headers(monkeypatch) -> Dict[str, str]:
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    return {"X-Admin-Token": "secret"}
+
+
+async def test_admin_access(client: AsyncClient, monkeypatch) -> None:
+    url, data = "/api/admin/doctors/reprice", {"percent": 10}
+    response = await client.post(url, json=data)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    # Closed without a token
+    response = await client.post(url, json=data, headers={"X-Admin-Token": ""})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    response = await client.post(url, json=data, headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+async def test_reprice_doctors(client: AsyncClient, db_context, random_area, admin_headers, monkeypatch) -> None:
+    params = {"area_id": str(random_area.id)}
+    before = (await client.get("/api/doctors/", params=params)).json()["items"]
+    response = await client.post(
+        "/api/admin/doctors/reprice", json={"area_id": str(random_area.id), "percent": 10}, headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    # Also the doctors without an English translation
+    assert response.json()["count"] >= len(before)
+
+    after = {item["id"]: item for item in (await client.get("/api/doctors/", params=params)).json()["items"]}
+    for item in before:
+        expected = (Decimal(str(item["price"])) * Decimal("1.1")).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        assert Decimal(str(after[item["id"]]["price"])) == expected
+        assert after[item["id"]]["updated_at"] > item["updated_at"]
+
+    # The read model is refreshed in the same transaction
+    monkeypatch.setattr(settings, "DOCTOR_READ_MODEL", True)
+    read = {item["id"]: item["price"] for item in (await client.get("/api/doctors/", params=params)).json()["items"]}
+    assert read == {id: item["price"] for id, item in after.items()}
+
+    response = await client.post(
+        "/api/admin/doctors/reprice", json={"area_id": str(random_area.id)}, headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_reprice_rounding_and_cap(
+    client: AsyncClient, doctor_data: Dict[str, Any], admin_headers: Dict[str, str]
+) -> None:
+    async def reprice(price: str, percent: str) -> Any:
+        doctor_id = (await client.post("/api/doctors/", json={**doctor_data, "price": price})).json()["id"]
+        data = {"area_id": doctor_data["area_id"], "price_min": price, "price_max": price, "percent": percent}
+        response = await client.post("/api/admin/doctors/reprice", json=data, headers=admin_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["count"] >= 1
+        response = await client.get(f"/api/doctors/{doctor_id}")
+        assert response.status_code == status.HTTP_200_OK
+        return Decimal(str(response.json()["price"]))
+
+    # Half up from the price as it's read: 1.265 and 1873.46 * 1.1 = 2060.806 (2060.8025 from the stored value)
+    assert await reprice("1.15", "10") == Decimal("1.27")
+    assert await reprice("1873.456789", "10") == Decimal("2060.81")
+    assert await reprice("50000", "1000") == Decimal(100000)
+    assert await reprice("77777", "-100") == Decimal(0)
+
+
+async def test_delete_where(db_context, doctor_data) -> None:
+    instance = await models.Doctor.create(obj_in={**doctor_data, "category_ids": []}, language=Language.English)
+    assert await models.DoctorTranslation.delete_where({"doctor_id": instance.id}) == 1
+    assert await models.DoctorTranslation.delete_where({"doctor_id": instance.id}) == 0
+    assert await models.Doctor.delete_where({"id": instance.id}) == 1
+    assert await models.Doctor.get(id=instance.id) is None
+
+
+async def test_write_where_locks_first(db_context, doctor_data: Dict[str, Any]) -> None:
+    instance = await models.Doctor.create(obj_in={**doctor_data, "category_ids": []}, language=Language.English)
+    statements = []
+
+    def _before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        statements.append(statement.split()[0])
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        assert await models.Doctor.update_where({"id": instance.id}, {"price": 1}, commit=False) == 1
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    # The write lock, then the rows on the same connection, then the write
+    assert statements[:3] == ["UPDATE", "SELECT", "UPDATE"]
@@ -0,0 +1,97 @@
+import base64
+import json
+import uuid
+
+import models
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from core.config import Language, settings
+from core.db.models import utcnow
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _all_changes(client: AsyncClient, since: str, limit: int) -> list:
+    items = []
+    while True:
+        response = await client.get("/api/doctors/changes", params={"since": since, "limit": limit})
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        items.extend(body["items"])
+        since = body["cursor"]
+        if not body["has_more"]:
+            return items
+
+
+async def test_doctor_changes(client: AsyncClient, db_context, doctor_data, random_category, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "CHANGES_SAFETY_LAG", 0)
+    since = base64.urlsafe_b64encode(json.dumps([utcnow().isoformat(), str(uuid.UUID(int=0))]).encode()).decode()
+    response = await client.get("/api/doctors/changes", params={"since": since})
+    assert response.json() == {"items": [], "cursor": since, "has_more": False}
+
+    instance = await models.Doctor.create(
+        obj_in={**doctor_data, "category_ids": [random_category.id]}, language=Language.English
+    )
+    await models.DoctorTranslation.delete_where({"doctor_id": instance.id, "language_code": Language.English.value})
+
+    # Paging one by one, each change once and in order
+    items = await _all_changes(client, since, limit=1)
+    changes = [(item["type"], item["deleted"]) for item in items]
+    assert sorted(changes) == [
+        ("doctors", False),
+        ("doctors_categories", False),
+        ("doctors_translation", True),
+    ]
+    assert [item["updated_at"] for item in items] == sorted(item["updated_at"] for item in items)
+    doctor = next(item for item in items if item["type"] == "doctors")
+    assert doctor["id"] == str(instance.id)
+    assert doctor["data"]["area_id"] == str(doctor_data["area_id"])
+    link = next(item for item in items if item["type"] == "doctors_categories")
+    assert link["data"]["category_id"] == str(random_category.id)
+    tombstone = next(item for item in items if item["deleted"])
+    assert tombstone["data"] is None
+
+    assert await _all_changes(client, since, limit=100) == items
+
+
+async def test_doctor_deletion_changes(
+    client: AsyncClient, db_context, doctor_data, random_category, monkeypatch
+) -> None:
+    monkeypatch.setattr(settings, "CHANGES_SAFETY_LAG", 0)
+    instance = await models.Doctor.create(
+        obj_in={**doctor_data, "category_ids": [random_category.id]}, language=Language.English
+    )
+    since = base64.urlsafe_b64encode(json.dumps([utcnow().isoformat(), str(uuid.UUID(int=0))]).encode()).decode()
+    assert await models.Doctor.delete_where({"id": instance.id}) == 1
+
+    # The translations and the category links are gone with the doctor, and deleted in the feed too
+    items = await _all_changes(client, since, limit=100)
+    assert sorted((item["type"], item["deleted"]) for item in items) == [
+        ("doctors", True),
+        ("doctors_categories", True),
+        ("doctors_translation", True),
+    ]
+    for model in (models.DoctorTranslation, models.DoctorCategory):
+        assert await model.delete_where({"doctor_id": instance.id}) == 0
+
+
+async def test_doctor_changes_safety_lag(client: AsyncClient, db_context, doctor_data, monkeypatch) -> None:
+    since = base64.urlsafe_b64encode(json.dumps([utcnow().isoformat(), str(uuid.UUID(int=0))]).encode()).decode()
+    instance = await models.Doctor.create(obj_in={**doctor_data, "category_ids": []}, language=Language.English)
+
+    # Too recent, a transaction flushed before it could still commit: the cursor doesn't move past it
+    monkeypatch.setattr(settings, "CHANGES_SAFETY_LAG", 60)
+    response = await client.get("/api/doctors/changes", params={"since": since})
+    assert response.json() == {"items": [], "cursor": since, "has_more": False}
+
+    monkeypatch.setattr(settings, "CHANGES_SAFETY_LAG", 0)
+    items = await _all_changes(client, since, limit=100)
+    assert str(instance.id) in {item["id"] for item in items}
+
+
+async def test_doctor_changes_invalid_cursor(client: AsyncClient) -> None:
+    response = await client.get("/api/doctors/changes", params={"since": "not a cursor"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,102 @@
+import asyncio
+import marshal
+
+import pytest
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+from main import dependencies
+from starlette.types import Message, Receive, Scope, Send
+
+from api.middlewares import ContextMiddleware, ProfilingMiddleware
+from api.profiling import profiles
+from api.routers import api_router
+from core.config import settings
+from core.db.base import engine, read_engine
+from core.db.slow_queries import slow_query_log
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_debug_endpoints_are_hidden(client: AsyncClient, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "DEBUG", False)
+    monkeypatch.setattr(settings, "DEBUG_TOKEN", "secret")
+    response = await client.get("/api/debug/slow-queries")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await client.get("/api/debug/slow-queries", headers={"X-Debug-Token": "wrong"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await client.get("/api/debug/slow-queries", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == status.HTTP_200_OK
+
+
+async def test_slow_queries_with_plan(client: AsyncClient, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "DEBUG", True)
+    monkeypatch.setattr(slow_query_log, "threshold", 0)
+    monkeypatch.setattr(slow_query_log, "rate_limit", 0)
+    engines = {engine, read_engine}
+    for item in engines:
+        slow_query_log.listen(item, read_engine)
+    try:
+        await client.get("/api/doctors/", params={"price_min": 10, "price_max": 2000})
+        await asyncio.sleep(0.1)
+    finally:
+        for item in engines:
+            slow_query_log.remove(item)
+
+    response = await client.get("/api/debug/slow-queries")
+    assert response.status_code == status.HTTP_200_OK
+    entry = next(item for item in response.json()["items"] if "FROM doctors" in item["statement"])
+    assert entry["route"] == "GET /api/doctors/"
+    assert "10" not in entry["parameters"] and "2000" not in entry["parameters"]
+    assert entry["plan"]
+
+
+async def test_profile_request(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "DEBUG", False)
+    monkeypatch.setattr(settings, "DEBUG_TOKEN", "secret")
+    profiled_app = FastAPI(dependencies=dependencies)
+    profiled_app.include_router(api_router, prefix="/api")
+    profiled_app.add_middleware(ProfilingMiddleware)
+    profiled_app.add_middleware(ContextMiddleware)
+    headers = {"X-Debug-Token": "secret"}
+
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        # Not profiled without the access to the debug endpoints
+        response = await client.get("/api/doctors/", params={"profile": 1})
+        assert "x-profile" not in response.headers
+
+        response = await client.get("/api/doctors/", params={"profile": 1}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["items"]
+        report = (await client.get(response.headers["x-profile"], headers=headers)).json()
+        assert report["route"] == "GET /api/doctors/"
+        assert report["db_statements"] > 0 and report["db_time"] > 0
+        assert report["serialisation_time"] > 0
+        assert 0 < len(report["functions"]) <= settings.PROFILE_TOP
+
+        response = await client.get(response.headers["x-profile"], params={"download": True}, headers=headers)
+        assert response.headers["content-disposition"].startswith("attachment")
+        assert marshal.loads(response.content)
+
+
+async def test_profile_stream_is_not_held_back(db_context: None, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "DEBUG", True)
+    sent, first_sent = [], asyncio.Event()
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        await send({"type": "http.response.body", "body": b"data: 1\n\n", "more_body": True})
+        # The event is out before the end of the stream
+        await asyncio.wait_for(first_sent.wait(), 1)
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _send(message: Message) -> None:
+        sent.append(message)
+        if message.get("more_body"):
+            first_sent.set()
+
+    scope = {"type": "http", "method": "GET", "path": "/stream", "headers": [(b"x-profile", b"1")], "query_string": b""}
+    await ProfilingMiddleware(app)(scope, None, _send)
+    assert [message["type"] for message in sent] == ["http.response.start"] + ["http.response.body"] * 2
+    profile_id = dict(sent[0]["headers"])[b"x-profile"].decode().rsplit("/", 1)[1]
+    assert profiles.get(profile_id)[0]["route"] == "GET /stream"
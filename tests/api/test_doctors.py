@@ -1,9 +1,16 @@
 import uuid
 from typing import Any, Dict
 
+import models
 import pytest
+import sqlalchemy as sa
 from fastapi import status
 from httpx import AsyncClient
+from sqlalchemy.dialects import mysql
+
+import core.db.models
+from core.config import Language, settings
+from core.db.base import engine
 
 
 pytestmark = pytest.mark.asyncio
@@ -52,3 +59,273 @@ async def test_create_doctor_valid_data(client: AsyncClient, doctor_data: Dict[s
     data = response.json()
     assert response.status_code == status.HTTP_201_CREATED
     assert data["phone_number"] == doctor_data["phone_number"]
+
+
+async def test_list_of_doctor_compressed(client: AsyncClient) -> None:
+    response = await client.get("/api/doctors/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["items"]) > 0
+
+
+async def test_small_response_not_compressed(client: AsyncClient) -> None:
+    response = await client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_200_OK
+    assert "content-encoding" not in response.headers
+
+
+async def test_doctor_facets(client: AsyncClient) -> None:
+    response = await client.get("/api/doctors/facets")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    doctors = (await client.get("/api/doctors/")).json()["items"]
+    assert sum(item["count"] for item in data["areas"]) == len(doctors)
+    assert sum(item["count"] for item in data["prices"]) == len(doctors)
+    assert all(item["name"] for item in data["areas"] + data["categories"])
+
+
+async def test_doctor_facets_keep_other_values_of_filtered_facet(client: AsyncClient, random_area) -> None:
+    response = await client.get("/api/doctors/facets", params={"area_id": random_area.id})
+    assert response.status_code == status.HTTP_200_OK
+    filtered = (await client.get("/api/doctors/", params={"area_id": random_area.id})).json()["items"]
+    data = response.json()
+    assert sum(item["count"] for item in data["prices"]) == len(filtered)
+    # The area filter is not applied to the area counts
+    assert data["areas"] == (await client.get("/api/doctors/facets")).json()["areas"]
+
+
+async def test_create_doctor_refresh_read_model(
+    client: AsyncClient, db_context, doctor_data: Dict[str, Any], random_category
+) -> None:
+    doctor_data["category_ids"] = [str(random_category.id)]
+    response = await client.post("/api/doctors/", json=doctor_data)
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+
+    instance = await models.DoctorRead.get(id=uuid.UUID(data["id"]), language=Language.English)
+    assert instance.name == doctor_data["name"]
+    assert instance.area_name
+    assert instance.category_ids == doctor_data["category_ids"]
+    translations = await models.CategoryTranslation.filter(
+        {"category_id": random_category.id, "language_code": Language.English}
+    )
+    assert instance.category_names == [translations.one().name]
+
+
+async def test_list_of_doctor_from_read_model(client: AsyncClient, monkeypatch) -> None:
+    items = (await client.get("/api/doctors/")).json()["items"]
+    monkeypatch.setattr(settings, "DOCTOR_READ_MODEL", True)
+    response = await client.get("/api/doctors/")
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(response.json()["items"], key=lambda item: item["id"]) == sorted(items, key=lambda item: item["id"])
+
+    response = await client.get(f"/api/doctors/{items[0]['id']}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == items[0]
+
+
+async def test_list_of_doctor_near(client: AsyncClient) -> None:
+    # The seeded areas are ~6.5km apart
+    response = await client.get("/api/doctors/", params={"near": "22.2783,114.1747", "radius": 10})
+    assert response.status_code == status.HTTP_200_OK
+    items = response.json()["items"]
+    assert len(items) == len((await client.get("/api/doctors/")).json()["items"])
+    distances = [item["distance"] for item in items]
+    assert distances == sorted(distances)
+    assert all(distance <= 10 for distance in distances)
+
+    response = await client.get("/api/doctors/", params={"near": "22.2783,114.1747", "radius": 1})
+    assert all(item["distance"] == 0 for item in response.json()["items"])
+
+
+@pytest.mark.skipif(not settings.IS_SQLITE, reason="R*Tree index of SQLite")
+async def test_area_index_after_renumbering() -> None:
+    # A copy of the table (batch migrations) or VACUUM can renumber the rowids of areas,
+    # the index must still point to the same areas
+    area_id = str(uuid.uuid4())
+    async with engine.begin() as connection:
+        await connection.execute(
+            sa.text(
+                "INSERT INTO areas (id, created_at, updated_at, latitude, longitude) "
+                "VALUES (:id, '2020-01-01', '2020-01-01', 1.0, 2.0)"
+            ),
+            {"id": area_id},
+        )
+        await connection.execute(
+            sa.text("UPDATE areas SET rowid = (SELECT max(rowid) + 1000 FROM areas) WHERE id = :id"), {"id": area_id}
+        )
+        rows = await connection.execute(
+            sa.text(
+                "SELECT areas.id, areas.latitude - areas_rtree.min_lat, areas.longitude - areas_rtree.min_lng "
+                "FROM areas_rtree JOIN areas_rtree_keys ON areas_rtree_keys.id = areas_rtree.id "
+                "LEFT JOIN areas ON areas.id = areas_rtree_keys.area_id"
+            )
+        )
+        rows = rows.all()
+        await connection.execute(sa.text("DELETE FROM areas WHERE id = :id"), {"id": area_id})
+
+    assert area_id in {row[0] for row in rows}
+    # The R*Tree stores 32-bit floats
+    assert all(row[0] is not None and abs(row[1]) < 1e-4 and abs(row[2]) < 1e-4 for row in rows)
+
+
+async def test_list_of_doctor_near_invalid(client: AsyncClient) -> None:
+    response = await client.get("/api/doctors/", params={"near": "122.2,114.1"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_list_of_doctor_category_match(client: AsyncClient, doctor_data: Dict[str, Any]) -> None:
+    categories = await models.Category.all()
+    category_ids = [str(category.id) for category in categories[:2]]
+    doctor_data["category_ids"] = category_ids
+    response = await client.post("/api/doctors/", json=doctor_data)
+    assert response.status_code == status.HTTP_201_CREATED
+    doctor_id = response.json()["id"]
+
+    params = {"category_ids": category_ids}
+    items = (await client.get("/api/doctors/", params=params)).json()["items"]
+    ids = [item["id"] for item in items]
+    assert len(ids) == len(set(ids)) and doctor_id in ids
+
+    items = (await client.get("/api/doctors/", params={**params, "category_match": "all"})).json()["items"]
+    assert doctor_id in [item["id"] for item in items]
+    assert all(set(category_ids) <= set(item["category_ids"]) for item in items)
+
+    response = await client.get("/api/doctors/", params={**params, "category_match": "some"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_list_of_doctor_sparse_fields(client: AsyncClient, monkeypatch) -> None:
+    full = (await client.get("/api/doctors/")).json()["items"]
+    response = await client.get("/api/doctors/", params={"fields": "id,name,price"})
+    assert response.status_code == status.HTTP_200_OK
+    items = response.json()["items"]
+    assert items == [{"id": item["id"], "name": item["name"], "price": item["price"]} for item in full]
+
+    items = (await client.get("/api/doctors/", params={"fields": "name,category_ids"})).json()["items"]
+    assert items == [{"name": item["name"], "category_ids": item["category_ids"]} for item in full]
+
+    monkeypatch.setattr(settings, "DOCTOR_READ_MODEL", True)
+    items = (await client.get("/api/doctors/", params={"fields": "id,category_ids"})).json()["items"]
+    assert sorted(items, key=lambda item: item["id"]) == sorted(
+        ({"id": item["id"], "category_ids": item["category_ids"]} for item in full), key=lambda item: item["id"]
+    )
+
+    response = await client.get("/api/doctors/", params={"fields": "id,password"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_batch_get_doctors(client: AsyncClient, monkeypatch) -> None:
+    full = (await client.get("/api/doctors/")).json()["items"][:5]
+    missing = str(uuid.uuid4())
+    ids = [full[3]["id"], missing, full[0]["id"], full[1]["id"], full[0]["id"]]
+    response = await client.post("/api/doctors/batch-get", json={"ids": ids})
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    by_id = {item["id"]: item for item in full}
+    assert data["items"] == [by_id[full[3]["id"]], by_id[full[0]["id"]], by_id[full[1]["id"]]]
+    assert data["missing"] == [missing]
+
+    monkeypatch.setattr(settings, "DOCTOR_READ_MODEL", True)
+    data = (await client.post("/api/doctors/batch-get", json={"ids": ids})).json()
+    assert [item["id"] for item in data["items"]] == [full[3]["id"], full[0]["id"], full[1]["id"]]
+    assert [item["category_ids"] for item in data["items"]] == [
+        by_id[item["id"]]["category_ids"] for item in data["items"]
+    ]
+
+    response = await client.post("/api/doctors/batch-get", json={"ids": []})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_doctor_translations(client: AsyncClient, monkeypatch) -> None:
+    params = {"languages": [Language.English.value, Language.Chinese.value]}
+    english_ids = {item["id"] for item in (await client.get("/api/doctors/")).json()["items"]}
+    chinese_items = (await client.get("/api/doctors/", headers={"X-Language-Code": "zh_CN"})).json()["items"]
+    chinese = next(item for item in chinese_items if item["id"] in english_ids)
+    english = (await client.get(f"/api/doctors/{chinese['id']}")).json()
+    assert english["translations"] is None
+    expected = {"en_GB": {"name": english["name"]}, "zh_CN": {"name": chinese["name"]}}
+
+    data = (await client.get(f"/api/doctors/{chinese['id']}", params=params)).json()
+    assert data["translations"] == expected
+
+    items = (await client.get("/api/doctors/", params=params)).json()["items"]
+    assert all(set(item["translations"]) <= {"en_GB", "zh_CN"} for item in items)
+    assert next(item for item in items if item["id"] == chinese["id"])["translations"] == expected
+
+    items = (await client.get("/api/doctors/", params={**params, "fields": "id,translations"})).json()["items"]
+    assert next(item for item in items if item["id"] == chinese["id"])["translations"] == expected
+
+    monkeypatch.setattr(settings, "DOCTOR_READ_MODEL", True)
+    data = (await client.get(f"/api/doctors/{chinese['id']}", params=params)).json()
+    assert data["translations"] == expected
+
+
+async def test_put_doctor_translation(
+    client: AsyncClient, db_context, doctor_data: Dict[str, Any], monkeypatch
+) -> None:
+    doctor_id = (await client.post("/api/doctors/", json=doctor_data)).json()["id"]
+    url = f"/api/doctors/{doctor_id}/translations/zh_CN"
+    for name in ("王医生", "李医生"):
+        response = await client.put(url, json={"name": name})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"doctor_id": doctor_id, "language_code": "zh_CN", "name": name}
+
+    translations = await models.DoctorTranslation.filter({"doctor_id": uuid.UUID(doctor_id)})
+    assert sorted(item.name for item in translations) == sorted([doctor_data["name"], "李医生"])
+    headers = {"X-Language-Code": "zh_CN"}
+    assert (await client.get(f"/api/doctors/{doctor_id}", headers=headers)).json()["name"] == "李医生"
+    monkeypatch.setattr(settings, "DOCTOR_READ_MODEL", True)
+    assert (await client.get(f"/api/doctors/{doctor_id}", headers=headers)).json()["name"] == "李医生"
+
+    response = await client.put(f"/api/doctors/{uuid.uuid4()}/translations/zh_CN", json={"name": "王医生"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_bulk_upsert_without_native_upsert(
+    client: AsyncClient, db_context, doctor_data: Dict[str, Any], monkeypatch
+) -> None:
+    monkeypatch.setattr(core.db.models, "UPSERT_DIALECTS", {})
+    doctor_id = uuid.UUID((await client.post("/api/doctors/", json=doctor_data)).json()["id"])
+    for name in ("王医生", "李医生"):
+        values = {"doctor_id": doctor_id, "language_code": Language.Chinese.value, "name": name}
+        await models.DoctorTranslation.upsert(values, constraint="uq_doctor_id_language_code")
+    translations = await models.DoctorTranslation.filter({"doctor_id": doctor_id})
+    assert sorted(item.name for item in translations) == sorted([doctor_data["name"], "李医生"])
+
+
+def test_upsert_statement_mysql() -> None:
+    rows = [{"id": uuid.uuid4(), "doctor_id": uuid.uuid4(), "language_code": "zh_CN", "name": "王医生"}]
+    statement = models.DoctorTranslation._upsert_statement(  # pylint: disable=W0212
+        "mysql", rows, ["doctor_id", "language_code"], ["name"]
+    )
+    sql = str(statement.compile(dialect=mysql.dialect()))
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "name = VALUES(name)" in sql and "updated_at = %s" in sql
+    statement = models.DoctorTranslation._upsert_statement(  # pylint: disable=W0212
+        "mysql", rows, ["doctor_id", "language_code"], []
+    )
+    assert "ON DUPLICATE KEY UPDATE doctor_id = doctors_translation.doctor_id" in str(
+        statement.compile(dialect=mysql.dialect())
+    )
+    assert models.DoctorTranslation._upsert_statement("mssql", rows, ["id"], ["name"]) is None  # pylint: disable=W0212
+
+
+async def test_filter_rows(db_context, db, random_area) -> None:
+    filters = {"area_id": random_area.id}
+    rows = await models.Doctor.filter_rows(filters, language=Language.English, languages=[Language.Chinese])
+    instances = await models.Doctor.filter(filters, language=Language.English)
+    assert [(row.id, row.name, row.price) for row in rows] == [
+        (instance.id, instance.name, instance.price) for instance in instances
+    ]
+    # The rows aren't tracked by the session
+    db.expunge_all()
+    await models.Doctor.filter_rows(filters, language=Language.English)
+    assert not db.identity_map
+    for row in rows:
+        assert row.category_ids == [
+            item.category_id for item in await models.DoctorCategory.filter({"doctor_id": row.id})
+        ]
+        assert set(row.translations) <= {Language.Chinese.value}
+    with pytest.raises(AttributeError):
+        rows[0].price = 0
@@ -0,0 +1,178 @@
+import asyncio
+import time
+import types
+
+import pytest
+import sqlalchemy as sa
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse
+
+from api.middlewares import AdmissionControlMiddleware, DeadlineMiddleware, PriorityLimiter, request_timeout
+from core.config import settings
+from core.context import request_context
+from core.db.base import _before_cursor_execute, _end_transaction
+from core.db.exceptions import DeadlineExceeded
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_limiter_rejects_when_queue_is_full() -> None:
+    limiter = PriorityLimiter(limit=1, max_queue=1)
+    assert await limiter.acquire(1, timeout=1)
+    waiter = asyncio.create_task(limiter.acquire(1, timeout=1))
+    await asyncio.sleep(0)
+    assert not await limiter.acquire(1, timeout=1)
+    limiter.release()
+    assert await waiter
+    limiter.release()
+    assert limiter.active == 0
+
+
+async def test_limiter_rejects_after_max_wait() -> None:
+    limiter = PriorityLimiter(limit=1, max_queue=10)
+    assert await limiter.acquire(1, timeout=1)
+    assert not await limiter.acquire(1, timeout=0.01)
+    limiter.release()
+    assert limiter.active == 0
+
+
+async def test_limiter_serves_writes_first() -> None:
+    limiter = PriorityLimiter(limit=1, max_queue=10)
+    assert await limiter.acquire(1, timeout=1)
+    read = asyncio.create_task(limiter.acquire(AdmissionControlMiddleware.READ, timeout=1))
+    write = asyncio.create_task(limiter.acquire(AdmissionControlMiddleware.WRITE, timeout=1))
+    await asyncio.sleep(0.01)
+    limiter.release()
+    await asyncio.sleep(0.01)
+    assert write.done() and not read.done()
+    limiter.release()
+    assert await read
+
+
+async def test_admission_control_overloaded() -> None:
+    release = asyncio.Event()
+
+    async def app(scope, receive, send) -> None:
+        await release.wait()
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    middleware = AdmissionControlMiddleware(app, limit=1, max_queue=0, max_wait=1, exempt_paths=["/"])
+    async with AsyncClient(app=middleware, base_url="http://test") as client:
+        running = asyncio.create_task(client.get("/api/doctors/"))
+        await asyncio.sleep(0.01)
+        response = await client.get("/api/doctors/")
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["retry-after"]
+        release.set()
+        # The health check is never queued
+        assert (await client.get("/")).status_code == status.HTTP_200_OK
+        assert (await running).status_code == status.HTTP_200_OK
+
+
+def test_request_timeout() -> None:
+    header = settings.REQUEST_TIMEOUT_HEADER
+    assert request_timeout(Headers({}), 30) == 30
+    assert request_timeout(Headers({header: "2.5"}), 30) == 2.5
+    assert request_timeout(Headers({header: "abc"}), 30) == 30
+    assert request_timeout(Headers({header: "-1"}), 30) == 30
+    assert request_timeout(Headers({header: "3600"}), 30) == settings.REQUEST_TIMEOUT_MAX
+
+
+async def test_deadline_over_before_statement(db: AsyncSession, db_context: None) -> None:
+    request_context.set_deadline(-1)
+    with pytest.raises(DeadlineExceeded):
+        await db.execute(sa.text("SELECT 1"))
+
+
+async def test_deadline_interrupts_running_statement(db: AsyncSession, db_context: None) -> None:
+    endless = sa.text(
+        "WITH RECURSIVE counter(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM counter) SELECT count(*) FROM counter"
+    )
+    request_context.set_deadline(0.2)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        await db.execute(endless)
+    assert time.monotonic() - started < 5
+    # The connection is still usable once the deadline is reset
+    request_context.set_deadline(5)
+    await db.rollback()
+    assert (await db.execute(sa.text("SELECT 1"))).scalar() == 1
+
+
+async def test_deadline_cancel_on_disconnect() -> None:
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send) -> None:
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    sent = []
+
+    async def send(message) -> None:
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    token = request_context.init()
+    try:
+        await asyncio.wait_for(DeadlineMiddleware(app)(scope, receive, send), 5)
+        assert request_context.remaining() < 0
+    finally:
+        request_context.reset(token)
+    assert cancelled.is_set()
+    assert sent[0]["status"] == 499
+
+
+class Cursor:
+    def __init__(self) -> None:
+        self.statements = []
+
+    def execute(self, statement: str) -> None:
+        self.statements.append(statement)
+
+
+async def test_statement_timeout_once_per_transaction(db_context: None) -> None:
+    conn = types.SimpleNamespace(info={}, dialect=types.SimpleNamespace(name="postgresql"))
+    cursor = Cursor()
+    request_context.set_deadline(10)
+    for _ in range(3):
+        _before_cursor_execute(conn, cursor, "SELECT 1", (), None, False)
+    assert len(cursor.statements) == 1
+    assert 9000 < int(cursor.statements[0].rsplit(" ", 1)[1]) <= 10000
+
+    # More than half of the budget of the last SET is spent
+    conn.info["statement_timeout"] = (request_context.get("deadline"), 25000)
+    _before_cursor_execute(conn, cursor, "SELECT 1", (), None, False)
+    assert len(cursor.statements) == 2
+    assert int(cursor.statements[1].rsplit(" ", 1)[1]) <= 10000
+
+    # A new transaction
+    _end_transaction(conn)
+    _before_cursor_execute(conn, cursor, "SELECT 1", (), None, False)
+    assert len(cursor.statements) == 3
+
+
+async def test_statement_timeout_only_on_postgresql(db_context: None) -> None:
+    conn = types.SimpleNamespace(info={}, dialect=types.SimpleNamespace(name="mysql"))
+    cursor = Cursor()
+    request_context.set_deadline(10)
+    _before_cursor_execute(conn, cursor, "SELECT 1", (), None, False)
+    assert cursor.statements == [] and conn.info == {}
+
+    request_context.set_deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        _before_cursor_execute(conn, cursor, "SELECT 1", (), None, False)
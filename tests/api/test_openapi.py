@@ -0,0 +1,21 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_openapi_schema(client: AsyncClient) -> None:
+    response = await client.get("/openapi.json")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"]
+    assert "/api/doctors/" in response.json()["paths"]
+
+
+async def test_openapi_schema_not_modified(client: AsyncClient) -> None:
+    response = await client.get("/openapi.json")
+    response = await client.get("/openapi.json", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not response.content
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import uuid
+
+import models
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from core.pubsub import Broker, pubsub
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_doctor_created_event(client: AsyncClient, doctor_data) -> None:
+    subscription = await pubsub.subscribe("doctors")
+    try:
+        response = await client.post("/api/doctors/", json=doctor_data)
+        assert response.status_code == status.HTTP_201_CREATED
+        # Published once committed
+        message = await asyncio.wait_for(subscription.get(), 1)
+        assert json.loads(message) == {"event": "created", "id": response.json()["id"]}
+    finally:
+        pubsub.unsubscribe(subscription)
+
+
+async def test_failed_commit_drops_events(db, db_context, monkeypatch) -> None:
+    subscription = await pubsub.subscribe("doctors")
+    try:
+        lost = uuid.uuid4()
+        models.Doctor.notify([lost])
+
+        async def _fail() -> None:
+            raise RuntimeError("Commit failed")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(db, "commit", _fail)
+            with pytest.raises(RuntimeError):
+                await models.Doctor.commit()
+
+        # The next transaction only publishes its own events
+        published = uuid.uuid4()
+        models.Doctor.notify([published])
+        await models.Doctor.commit()
+        message = await asyncio.wait_for(subscription.get(), 1)
+        assert json.loads(message) == {"event": "updated", "id": str(published)}
+        assert subscription.queue.empty()
+    finally:
+        pubsub.unsubscribe(subscription)
+
+
+def test_broker_interface() -> None:
+    class Incomplete(Broker):
+        async def publish(self, channel: str, message: str) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+async def test_stream_doctors(client: AsyncClient) -> None:
+    request = asyncio.ensure_future(client.get("/api/doctors/stream", headers={"Accept-Encoding": "gzip"}))
+    while not pubsub.subscriber_count:
+        await asyncio.sleep(0.01)
+    await pubsub.publish("doctors", '{"event": "updated"}')
+    # Ends the stream
+    await pubsub.stop()
+    response = await asyncio.wait_for(request, 1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "content-encoding" not in response.headers
+    assert response.text == 'retry: 3000\n\ndata: {"event": "updated"}\n\n'
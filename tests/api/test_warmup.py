@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from main import build_openapi
+
+from api.warmup import Readiness, compile_statements, open_connections, readiness
+from core.db.base import engine, read_engine
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_health_check_not_ready(client: AsyncClient, monkeypatch) -> None:
+    monkeypatch.setattr(readiness, "ready", False)
+    response = await client.get("/")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json()["ready"] is False
+
+    monkeypatch.setattr(readiness, "ready", True)
+    response = await client.get("/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["ready"] is True
+
+
+async def test_warm_up_retries() -> None:
+    calls = []
+
+    async def flaky() -> None:
+        calls.append(len(calls))
+        if len(calls) < 2:
+            raise ConnectionError("Not yet")
+
+    warmup = Readiness()
+    warmup.start([flaky, compile_statements, build_openapi], retry=0, attempts=3)
+    await warmup.task
+    assert warmup.ready
+    assert calls == [0, 1]
+
+
+async def test_warm_up_gives_up(caplog) -> None:
+    calls = []
+
+    async def broken() -> None:
+        calls.append(len(calls))
+        raise ConnectionError("Never")
+
+    warmup = Readiness()
+    warmup.start([broken, build_openapi], retry=0, attempts=3)
+    await asyncio.wait_for(warmup.task, 1)
+    # Skipped, the worker is ready without it
+    assert warmup.ready
+    assert calls == [0, 1, 2]
+    assert "Warm-up broken failed 3 times, skipped" in caplog.text
+
+
+async def test_open_connections() -> None:
+    pool = read_engine.sync_engine.pool
+    opened = await open_connections(read_engine)
+    if read_engine is engine:
+        # NullPool of the SQLite file database
+        assert opened == 0
+    else:
+        assert opened == pool.size()
+        assert pool.checkedin() == pool.size()
@@ -4,13 +4,11 @@ from typing import Generator
 import pytest
 from httpx import AsyncClient
 from main import app
-from sqlalchemy import event
-from sqlalchemy.engine import Transaction
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session
 
+from api.warmup import readiness
 from core.context import request_context
-from core.db.base import engine
+from core.db.base import async_session
 
 
 @pytest.fixture(scope="session")
@@ -22,10 +20,9 @@ def event_loop(request) -> asyncio.AbstractEventLoopPolicy:
 
 @pytest.fixture
 async def db() -> AsyncSession:
-    connection = await engine.connect()
-    session = AsyncSession(bind=connection, expire_on_commit=False, future=True)
+    session = async_session()
     yield session
-    await connection.close()
+    await session.close()
 
 
 @pytest.fixture
@@ -36,7 +33,22 @@ def db_context(db: AsyncSession) -> None:
     request_context.reset(token)
 
 
+@pytest.fixture(scope="session")
+async def started_app() -> None:
+    """
+    Run the startup of the app and wait for its warm-up, the test client doesn't
+    """
+    await app.router.startup()
+    if readiness.task is not None:
+        try:
+            await asyncio.wait_for(readiness.task, 30)
+        except asyncio.TimeoutError:
+            pytest.exit("The warm-up is still failing, is the test database migrated? (tests.sh)", returncode=1)
+    yield
+    await app.router.shutdown()
+
+
 @pytest.fixture
-async def client(db) -> Generator[AsyncClient, None, None]:
+async def client(db, started_app) -> Generator[AsyncClient, None, None]:
     async with AsyncClient(app=app, base_url="http://test") as client:
         yield client
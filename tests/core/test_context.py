@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from core.config import Language
+from core.context import RequestState, request_context
+
+
+def test_state_per_request() -> None:
+    token = request_context.init()
+    request_context.set("language", Language.Chinese)
+    request_context.set_deadline(5)
+    request_context.reset(token)
+
+    token = request_context.init()
+    try:
+        assert request_context.language == Language.English
+        assert request_context.remaining() is None
+        with pytest.raises(AttributeError):
+            request_context.set("unknown", 1)
+        assert not hasattr(request_context.state, "__dict__")
+    finally:
+        request_context.reset(token)
+
+
+def test_outside_of_a_request() -> None:
+    def outside() -> None:
+        assert not request_context.exists()
+        assert request_context.current() is None
+        with pytest.raises(RuntimeError):
+            request_context.get("db")
+
+    # A context without the request state, like a request that skips the middleware
+    contextvars.Context().run(outside)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_isolated() -> None:
+    async def handle(language: Language) -> Language:
+        request_context.init(route=f"GET /{language.value}")
+        request_context.set("language", language)
+        await asyncio.sleep(0)
+        return request_context.language
+
+    assert await asyncio.gather(*(handle(language) for language in Language)) == list(Language)
+
+
+def test_init_values() -> None:
+    state = RequestState(route="GET /", language=Language.Chinese)
+    assert (state.route, state.language, state.db) == ("GET /", Language.Chinese, None)
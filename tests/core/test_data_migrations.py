@@ -0,0 +1,127 @@
+import datetime
+import uuid
+from decimal import Decimal
+from typing import List
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from core.db import data_migrations as module
+from core.db.data_migrations import DataMigration, data_migrations, dump_key, load_key, update
+from core.db.types import UUID
+
+
+metadata = sa.MetaData()
+items = sa.Table(
+    "items",
+    metadata,
+    sa.Column("id", UUID(), primary_key=True),
+    sa.Column("value", sa.Integer(), nullable=False),
+)
+double = update(items, {"value": items.c.value * 2})
+events = sa.Table(
+    "events",
+    metadata,
+    sa.Column("created_at", sa.DateTime(), primary_key=True),
+    sa.Column("value", sa.Integer(), nullable=False),
+)
+
+
+@pytest.fixture
+def engine(tmp_path) -> sa.engine.Engine:
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'data.db'}")
+    metadata.create_all(engine)
+    data_migrations.create(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.insert(items), [{"id": uuid.uuid4(), "value": value} for value in range(25)])
+    yield engine
+    engine.dispose()
+
+
+def _values(engine: sa.engine.Engine) -> List[int]:
+    with engine.connect() as connection:
+        return sorted(connection.execute(sa.select(items.c.value)).scalars())
+
+
+def test_resume_after_failure(engine) -> None:
+    calls = []
+
+    def interrupted(connection, rows, condition) -> None:
+        calls.append(len(rows))
+        double(connection, rows, condition)
+        if len(calls) == 3:
+            raise RuntimeError("Interrupted")
+
+    with pytest.raises(RuntimeError):
+        DataMigration("double", items, interrupted, batch_size=10, rate=0).run(engine)
+    # The first two batches are committed with their checkpoint, the third is rolled back
+    with engine.connect() as connection:
+        checkpoint = connection.execute(sa.select(data_migrations)).mappings().one()
+    assert checkpoint["rows"] == 20 and checkpoint["finished_at"] is None
+    assert len([value for value in _values(engine) if value % 2]) <= 5
+
+    assert DataMigration("double", items, double, batch_size=10, rate=0).run(engine) == 25
+    doubled = _values(engine)
+    assert doubled == sorted(value * 2 for value in range(25))
+    # Done, the next runs are no-ops
+    assert DataMigration("double", items, double, batch_size=10, rate=0).run(engine) == 25
+    assert _values(engine) == doubled
+
+
+def test_throttle(engine, monkeypatch) -> None:
+    sleeps = []
+    monkeypatch.setattr(module.time, "sleep", sleeps.append)
+    DataMigration("noop", items, lambda *args: None, batch_size=10, rate=1).run(engine)
+    # 1 row/s: 10, 20 then 25 rows in
+    assert [round(sleep) for sleep in sleeps] == [10, 20, 25]
+
+
+def test_run_in_migration(engine) -> None:
+    migration = DataMigration("reset", items, update(items, {"value": 0}), batch_size=10, rate=0)
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        with Operations.context(context), context.begin_transaction():
+            assert migration.run_in_migration() == 25
+    assert _values(engine) == [0] * 25
+
+    migration.reset(engine)
+    with engine.connect() as connection:
+        assert connection.execute(sa.select(sa.func.count()).select_from(data_migrations)).scalar() == 0
+
+
+def test_resume_on_datetime_key(engine) -> None:
+    start = datetime.datetime(2021, 1, 1, 12, 30, 15, 250000)
+    with engine.begin() as connection:
+        connection.execute(
+            sa.insert(events),
+            [{"created_at": start + datetime.timedelta(minutes=value), "value": value} for value in range(25)],
+        )
+    double_events = update(events, {"value": events.c.value * 2})
+
+    def interrupted(connection, rows, condition) -> None:
+        if rows[0][0] > start:
+            raise RuntimeError("Interrupted")
+        double_events(connection, rows, condition)
+
+    with pytest.raises(RuntimeError):
+        DataMigration("events", events, interrupted, key="created_at", batch_size=10, rate=0).run(engine)
+    assert DataMigration("events", events, double_events, key="created_at", batch_size=10, rate=0).run(engine) == 25
+    with engine.connect() as connection:
+        assert sorted(connection.execute(sa.select(events.c.value)).scalars()) == [value * 2 for value in range(25)]
+
+
+@pytest.mark.parametrize(
+    "key_type, value",
+    [
+        (sa.Integer(), 42),
+        (sa.String(), "b"),
+        (sa.Numeric(), Decimal("1.50")),
+        (sa.Date(), datetime.date(2021, 1, 1)),
+        (sa.DateTime(timezone=True), datetime.datetime(2021, 1, 1, 12, 30, tzinfo=datetime.timezone.utc)),
+        (UUID(), uuid.uuid4()),
+    ],
+)
+def test_checkpoint_key(key_type, value, engine) -> None:
+    assert load_key(dump_key(value), key_type, engine.dialect) == value
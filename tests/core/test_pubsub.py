@@ -0,0 +1,37 @@
+import pytest
+
+from core.pubsub import LocalBroker, PubSub, TooManySubscribers
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_fan_out() -> None:
+    pubsub = PubSub(LocalBroker(), queue_size=10, max_subscribers=2)
+    first, second = await pubsub.subscribe("doctors"), await pubsub.subscribe("doctors")
+    with pytest.raises(TooManySubscribers):
+        await pubsub.subscribe("areas")
+    await pubsub.publish("doctors", "a")
+    await pubsub.publish("areas", "b")
+    assert [await first.get(), await second.get()] == ["a", "a"]
+    assert first.queue.empty()
+
+    pubsub.unsubscribe(first)
+    assert pubsub.subscriber_count == 1
+    await pubsub.stop()
+    assert await second.get() is None
+    assert pubsub.subscriber_count == 0
+
+
+async def test_slow_subscriber_dropped() -> None:
+    pubsub = PubSub(LocalBroker(), queue_size=2, max_subscribers=10)
+    slow, fast = await pubsub.subscribe("doctors"), await pubsub.subscribe("doctors")
+    for message in ("a", "b"):
+        await pubsub.publish("doctors", message)
+        assert await fast.get() == message
+    await pubsub.publish("doctors", "c")
+    assert slow.dropped
+    # Its pending messages are freed
+    assert await slow.get() is None
+    assert await fast.get() == "c"
+    assert pubsub.subscriptions["doctors"] == {fast}
@@ -0,0 +1,91 @@
+from typing import Any, List, Tuple
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.config import settings
+from core.db import base
+from core.db.base import RoutingSession, _sqlite_pragmas
+
+
+pytestmark = pytest.mark.asyncio
+
+items = sa.table("items", sa.column("id", sa.Integer))
+
+
+@pytest.fixture
+async def engines(tmp_path, monkeypatch) -> Tuple[AsyncEngine, AsyncEngine, List[Tuple[str, str]]]:
+    """
+    A writer and a read-only engine of a new database in WAL mode, set up like core.db.base, and the
+    (engine, statement) of each query
+    """
+    path = str(tmp_path / "wal.db")
+    writer = create_async_engine(
+        URL.create("sqlite+aiosqlite", database=path), poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0
+    )
+    reader = create_async_engine(
+        URL.create("sqlite+aiosqlite", database=f"file:{path}", query={"mode": "ro", "uri": "true"}),
+        poolclass=AsyncAdaptedQueuePool,
+    )
+    event.listen(writer.sync_engine, "connect", _sqlite_pragmas(read_only=False))
+    event.listen(reader.sync_engine, "connect", _sqlite_pragmas(read_only=True))
+    statements: List[Tuple[str, str]] = []
+    for name, item in (("writer", writer), ("reader", reader)):
+
+        def _record(conn: Any, cursor: Any, statement: str, *args: Any, name: str = name) -> None:
+            statements.append((name, statement.split()[0]))
+
+        event.listen(item.sync_engine, "before_cursor_execute", _record)
+
+    async with writer.begin() as connection:
+        await connection.execute(sa.text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+    monkeypatch.setattr(base, "engine", writer)
+    monkeypatch.setattr(base, "read_engine", reader)
+    statements.clear()
+    yield writer, reader, statements
+    await writer.dispose()
+    await reader.dispose()
+
+
+async def test_wal_mode(engines) -> None:
+    writer, reader, _ = engines
+    for engine in (writer, reader):
+        async with engine.connect() as connection:
+            assert (await connection.execute(sa.text("PRAGMA journal_mode"))).scalar() == "wal"
+    async with reader.connect() as connection:
+        # Read-only, SQLite itself rejects the writes
+        with pytest.raises(sa.exc.OperationalError):
+            await connection.execute(sa.insert(items).values(id=1))
+
+
+async def test_routing(engines) -> None:
+    writer, _, statements = engines
+    session = AsyncSession(writer, sync_session_class=RoutingSession)
+    try:
+        await session.execute(sa.select(items.c.id))
+        assert statements == [("reader", "SELECT")]
+
+        # Once written, the transaction stays on the writer and reads its own rows
+        statements.clear()
+        await session.execute(sa.insert(items).values(id=1))
+        assert (await session.execute(sa.select(items.c.id))).scalars().all() == [1]
+        assert statements == [("writer", "INSERT"), ("writer", "SELECT")]
+
+        # Back to the readers after the commit
+        await session.commit()
+        statements.clear()
+        assert (await session.execute(sa.select(items.c.id))).scalars().all() == [1]
+        assert statements == [("reader", "SELECT")]
+    finally:
+        await session.close()
+
+
+@pytest.mark.skipif(not settings.DB_SQLITE_WAL, reason="WAL mode is off")
+async def test_app_engines_in_wal_mode() -> None:
+    assert base.read_engine is not base.engine
+    async with base.engine.connect() as connection:
+        assert (await connection.execute(sa.text("PRAGMA journal_mode"))).scalar() == "wal"
@@ -0,0 +1,25 @@
+from core.db.slow_queries import SlowQueryLog, normalise, redact
+
+
+def test_normalise() -> None:
+    assert normalise("SELECT *\n  FROM doctors WHERE price > 10.5 AND name = 'O''Neil'") == (
+        "SELECT * FROM doctors WHERE price > ? AND name = ?"
+    )
+    assert normalise("SELECT * FROM t1 WHERE id IN (?, ?, ?)") == normalise("SELECT * FROM t1 WHERE id IN (?)")
+    assert normalise("SELECT * FROM t1 WHERE id IN ($1, $2)") == "SELECT * FROM t1 WHERE id IN (...)"
+
+
+def test_redact() -> None:
+    assert redact(("secret", 1)) == ["str", "int"]
+    assert redact({"name": "secret"}) == {"name": "str"}
+    assert redact([(1,), (2,)], executemany=True) == "<2 rows>"
+
+
+def test_rate_limit_per_fingerprint() -> None:
+    log = SlowQueryLog(threshold=0, size=2, rate_limit=60)
+    log.record("SELECT * FROM doctors WHERE price > 10", (), 1)
+    log.record("SELECT * FROM doctors WHERE price > 20", (), 1)
+    log.record("SELECT * FROM areas", (), 1)
+    entries = log.dump()
+    assert [entry["statement"] for entry in entries] == ["SELECT * FROM areas", "SELECT * FROM doctors WHERE price > ?"]
+    assert entries[1]["suppressed"] == 1
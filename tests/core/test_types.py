@@ -0,0 +1,16 @@
+from core.db.types import UUID, uuid7
+
+
+def test_uuid7_version() -> None:
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == "specified in RFC 4122"
+
+
+def test_uuid7_monotonic() -> None:
+    values = [uuid7() for _ in range(10000)]
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+    # The stored hex keeps the same order as the keys
+    stored = [UUID().process_bind_param(value, None) for value in values]
+    assert stored == sorted(stored)
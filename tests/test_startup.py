@@ -0,0 +1,10 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_faker_not_imported_by_app() -> None:
+    # The tests themselves import Faker, check the import graph of the app in a fresh interpreter
+    code = "import sys, main; sys.exit('faker' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1])
+    assert result.returncode == 0